@@ -3,14 +3,20 @@ from flask_restful import Api
 from models.book import db
 from schemas.book import ma
 from config import Config
-from resources.book import BookListResource, BookResource
+from commands import books_cli
+from resources.book_resources import (BookExportResource, BookImportResource, BookJobResource, BookListResource,
+                                      BookResource, BookSearchResource, BookSuggestResource, BookUpsertResource)
+from resources.stats_resources import StatsResource
+from utils.suggest import suggest_index
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.cli.add_command(books_cli)
 
 # Initialize DB & Marshmallow
 db.init_app(app)
 ma.init_app(app)
+suggest_index.init_app(app)
 
 # RESTful API setup
 api = Api(app)
@@ -18,6 +24,13 @@ api = Api(app)
 # Routes
 api.add_resource(BookListResource, '/books')
 api.add_resource(BookResource, '/books/<int:book_id>')
+api.add_resource(BookSearchResource, '/books/search')
+api.add_resource(BookSuggestResource, '/books/suggest')
+api.add_resource(BookImportResource, '/books/import')
+api.add_resource(BookExportResource, '/books/export')
+api.add_resource(BookUpsertResource, '/books:upsert')
+api.add_resource(BookJobResource, '/books/jobs/<job_id>')
+api.add_resource(StatsResource, '/stats')
 
 @app.route('/')
 def home():
@@ -0,0 +1,76 @@
+# Per-row cost of reading and dumping a page of books as Book instances
+# (the old list path), as ORM column rows, and as Core rows over the table
+# columns (utils/rows.py, what the GET resources use now).
+#
+#   python benchmarks/read_path.py [rows] [repeat]
+#
+# CPU is process time, best of repeat. Peak is the tracemalloc high-water
+# mark while fetching and dumping; blocks is what the fetched result still
+# holds per row afterwards (identity map and instance state included).
+# Drops and recreates the tables, so it runs on an in-memory SQLite
+# database; DATABASE_URL is ignored. Point BENCHMARK_DATABASE_URL at a
+# scratch database to measure another backend.
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = os.environ.get("BENCHMARK_DATABASE_URL", "sqlite://")
+
+from app import app  # noqa: E402
+from models.book import Book, db  # noqa: E402
+from schemas.book import get_dumper  # noqa: E402
+from utils.rows import BOOK_TABLE, book_columns  # noqa: E402
+
+
+def measure(fetch, dump, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.rollback()
+        db.session.expunge_all()
+        gc.collect()
+        start = time.process_time()
+        dump(fetch())
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    db.session.rollback()
+    db.session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    result = fetch()
+    held = sys.getallocatedblocks() - blocks
+    dump(result)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return best * 1e6 / rows, peak / rows, held / rows
+
+
+def main(rows=10000, repeat=5):
+    dump = get_dumper(many=True)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(db.insert(Book), [{"title": "Title %d" % i, "author": "Author %d" % (i % 500)}
+                                             for i in range(rows)])
+        db.session.commit()
+
+        cases = [
+            ("Book instances", lambda: db.session.scalars(db.select(Book).order_by(Book.id)).all()),
+            ("ORM column rows", lambda: db.session.execute(
+                db.select(Book.id, Book.title, Book.author, Book.version, Book.updated_at).order_by(Book.id)).all()),
+            ("Core rows", lambda: db.session.execute(
+                db.select(*book_columns(extra=("version", "updated_at"))).order_by(BOOK_TABLE.c.id)).all()),
+        ]
+        print("%d rows, fetch + dump" % rows)
+        print("  %-16s %10s %12s %12s" % ("", "cpu us/row", "peak B/row", "blocks/row"))
+        for label, fetch in cases:
+            print("  %-16s %10.2f %12.0f %12.1f" % ((label,) + measure(fetch, dump, rows, repeat)))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
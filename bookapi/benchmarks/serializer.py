@@ -0,0 +1,50 @@
+# Compares the compiled dumper with BookSchema.dump and Book.to_dict on
+# ORM objects and Core rows, and checks that all of them agree.
+#
+#   python benchmarks/serializer.py [rows] [repeat]
+#
+# Drops and recreates the tables, so it runs on an in-memory SQLite
+# database; DATABASE_URL is ignored. Point BENCHMARK_DATABASE_URL at a
+# scratch database to measure another backend.
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = os.environ.get("BENCHMARK_DATABASE_URL", "sqlite://")
+
+from app import app  # noqa: E402
+from models.book import Book, db  # noqa: E402
+from schemas.book import BookSchema, get_dumper  # noqa: E402
+
+
+def main(rows=10000, repeat=5):
+    schema = BookSchema(many=True)
+    dump = get_dumper(many=True)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(db.insert(Book), [{"title": "Title %d" % i, "author": "Author %d" % (i % 500)}
+                                             for i in range(rows)])
+        db.session.commit()
+        books = db.session.scalars(db.select(Book).order_by(Book.id)).all()
+        core = db.session.execute(db.select(Book.id, Book.title, Book.author).order_by(Book.id)).all()
+
+        assert dump(books) == schema.dump(books) == [book.to_dict() for book in books]
+        assert dump(core) == schema.dump(core)
+
+        cases = [
+            ("BookSchema.dump, ORM objects", lambda: schema.dump(books)),
+            ("Book.to_dict, ORM objects", lambda: [book.to_dict() for book in books]),
+            ("compiled dump, ORM objects", lambda: dump(books)),
+            ("BookSchema.dump, Core rows", lambda: schema.dump(core)),
+            ("compiled dump, Core rows", lambda: dump(core)),
+        ]
+        print("%d rows, best of %d" % (rows, repeat))
+        for label, fn in cases:
+            best = min(timeit.repeat(fn, number=1, repeat=repeat))
+            print("  %-30s %8.2f ms  %6.2f us/row" % (label, best * 1000, best * 1e6 / rows))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
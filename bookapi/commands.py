@@ -0,0 +1,36 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models.book import db
+from schemas.book import BookSchema
+from utils.importer import READ_ERRORS, detect_format, import_books, open_text
+
+books_cli = AppGroup("books", help="Catalog maintenance commands.")
+
+
+@books_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), help="Defaults to the file extension.")
+@click.option("--gzip/--no-gzip", "compressed", default=None, help="Defaults to the file extension.")
+def import_command(path, fmt, compressed):
+    """Load books from a CSV or NDJSON file (optionally .gz)."""
+    detected_fmt, detected_gzip = detect_format(path)
+    fmt = fmt or detected_fmt
+    if fmt is None:
+        raise click.UsageError("cannot tell the format from the file name; pass --format")
+    if compressed is None:
+        compressed = detected_gzip
+
+    with open(path, "rb") as stream:
+        try:
+            report = import_books(db.session, open_text(stream, compressed), fmt, BookSchema(),
+                                  current_app.config["BOOKS_BULK_BATCH_SIZE"])
+        except READ_ERRORS as err:
+            db.session.rollback()
+            raise click.ClickException("could not read %s: %s" % (path, err))
+    result = report.to_dict()
+    click.echo("imported %(imported)d rows, rejected %(rejected)d (%(duplicates)d duplicates) in %(seconds)ss "
+               "(%(rows_per_second)s rows/s)" % result)
+    for error in result["errors"]:
+        click.echo("  line %(line)s: %(errors)s" % error, err=True)
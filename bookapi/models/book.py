@@ -1,13 +1,142 @@
+import time
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from config import Config
 
 db = SQLAlchemy()
 
+# whether ix_new_book_author_title is unique; checked by everything that
+# relies on it instead of the config
+UNIQUE_NATURAL_KEY = Config.BOOKS_UNIQUE_NATURAL_KEY
+
 class Book(db.Model):
     __tablename__ = 'new_book'
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(200), nullable=False)
+    # optimistic concurrency: exposed as the item ETag, checked by If-Match
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # drives Last-Modified and the list validators for conditional GETs
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=db.func.now(), onupdate=db.func.now())
+
+    __mapper_args__ = {'version_id_col': version}
+
+    __table_args__ = (
+        # keyset pagination for ?sort=title / ?sort=author
+        db.Index('ix_new_book_title_id', 'title', 'id'),
+        db.Index('ix_new_book_author_id', 'author', 'id'),
+        # ?author=... (optionally sorted by title) is answered by an
+        # index-only scan: every column the paged listing reads, version for
+        # its ETag included, lives in the index. When (title, author) is the
+        # natural key it also backs ON CONFLICT.
+        db.Index('ix_new_book_author_title', 'author', 'title', postgresql_include=['id', 'version'],
+                 unique=UNIQUE_NATURAL_KEY),
+        # ?title_prefix=... is LIKE 'prefix%' on lower(title); pattern ops
+        # keep the index usable under non-C collations
+        db.Index('ix_new_book_title_lower', db.func.lower(title).label('title_lower'),
+                 postgresql_ops={'title_lower': 'varchar_pattern_ops'}),
+    )
 
     def to_dict(self):
         return {"id": self.id, "title": self.title, "author": self.author}
+
+
+class CatalogVersion(db.Model):
+    # Validators for the whole catalog without scanning it: triggers on
+    # new_book bump a counter row in the writing transaction, whoever writes
+    # (this app, psql, a migration, COPY). The version is the sum over
+    # CATALOG_VERSION_STRIPES rows; each Postgres connection bumps its own
+    # stripe, so concurrent writers rarely queue on one row lock. The lock
+    # is still held from the write to the commit, and writers that share a
+    # stripe do wait for each other.
+    __tablename__ = 'new_book_catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    changed_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+
+
+CATALOG_VERSION_STRIPES = 16
+
+
+@event.listens_for(CatalogVersion.__table__, 'after_create')
+def _seed_catalog_version(table, connection, **kw):
+    # starts at the creation time in microseconds, so a recreated table
+    # never repeats a version an old snapshot or ETag was built at
+    connection.execute(table.insert(), [{"id": stripe, "version": time.time_ns() // 1000 if stripe == 0 else 0}
+                                        for stripe in range(CATALOG_VERSION_STRIPES)])
+
+
+# Postgres fires once per statement, SQLite (no statement triggers) once per
+# row. Statements that change nothing are bumped too on Postgres, which only
+# costs a revalidation; the app rolls those back anyway. clock_timestamp(),
+# not now(): now() is the transaction's start.
+_catalog_version_ddl = {
+    'postgresql': [
+        "CREATE OR REPLACE FUNCTION new_book_bump_catalog_version() RETURNS trigger LANGUAGE plpgsql AS $$ "
+        "BEGIN "
+        "UPDATE new_book_catalog_version SET version = version + 1, changed_at = clock_timestamp() "
+        "WHERE id = mod(pg_backend_pid(), %d); "
+        "RETURN NULL; "
+        "END $$" % CATALOG_VERSION_STRIPES,
+        "DROP TRIGGER IF EXISTS new_book_catalog_version ON new_book",
+        "CREATE TRIGGER new_book_catalog_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON new_book "
+        "FOR EACH STATEMENT EXECUTE FUNCTION new_book_bump_catalog_version()",
+    ],
+    'sqlite': [
+        "CREATE TRIGGER IF NOT EXISTS new_book_catalog_version_%s AFTER %s ON new_book BEGIN "
+        "UPDATE new_book_catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP "
+        "WHERE id = 0; END" % (suffix, operation)
+        for suffix, operation in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE"))
+    ],
+}
+
+# on the metadata: both tables exist by then, also when create_all only adds
+# the counter table to an existing database
+for _dialect, _statements in _catalog_version_ddl.items():
+    for _statement in _statements:
+        event.listen(db.metadata, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+event.listen(db.metadata, 'after_drop',
+             DDL("DROP FUNCTION IF EXISTS new_book_bump_catalog_version()").execute_if(dialect='postgresql'))
+
+
+# Full-text search. Postgres keeps a generated tsvector column with a GIN
+# index; SQLite (local/test) keeps an external-content FTS5 table in sync
+# through triggers. Neither is mapped on the model, so normal reads never
+# load the vector.
+_search_ddl = {
+    'postgresql': [
+        "ALTER TABLE new_book ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(author, '')), 'B')) STORED",
+        "CREATE INDEX ix_new_book_search_vector ON new_book USING gin (search_vector)",
+        # trigram indexes for fuzzy (?fuzzy=1) lookups; GiST rather than GIN
+        # because only GiST can return rows in `<->` distance order
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX ix_new_book_title_trgm ON new_book USING gist (title gist_trgm_ops)",
+        "CREATE INDEX ix_new_book_author_trgm ON new_book USING gist (author gist_trgm_ops)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS new_book_fts USING fts5("
+        "title, author, content='new_book', content_rowid='id')",
+        "CREATE TRIGGER new_book_fts_ai AFTER INSERT ON new_book BEGIN "
+        "INSERT INTO new_book_fts (rowid, title, author) VALUES (new.id, new.title, new.author); END",
+        "CREATE TRIGGER new_book_fts_ad AFTER DELETE ON new_book BEGIN "
+        "INSERT INTO new_book_fts (new_book_fts, rowid, title, author) "
+        "VALUES ('delete', old.id, old.title, old.author); END",
+        "CREATE TRIGGER new_book_fts_au AFTER UPDATE ON new_book BEGIN "
+        "INSERT INTO new_book_fts (new_book_fts, rowid, title, author) "
+        "VALUES ('delete', old.id, old.title, old.author); "
+        "INSERT INTO new_book_fts (rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    ],
+}
+
+for _dialect, _statements in _search_ddl.items():
+    for _statement in _statements:
+        event.listen(Book.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+event.listen(Book.__table__, 'before_drop',
+             DDL("DROP TABLE IF EXISTS new_book_fts").execute_if(dialect='sqlite'))
@@ -1,48 +1,444 @@
 from flask_restful import Resource
-from flask import request
-from models.book import Book, db
-from schemas.book import BookSchema
+from flask import current_app, request, url_for
+from marshmallow import EXCLUDE, ValidationError
+from models.book import UNIQUE_NATURAL_KEY, Book, db
+from schemas.book import BookSchema, get_dumper, parse_fields
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from utils.bulk import bulk_delete, bulk_update, count_matching, insert_books, insert_new_books, upsert_books
+from utils.changes import record_change
+from utils.conditional import (catalog_stamp, if_match_versions, not_modified, validators, version_etag,
+                               version_matches, weak_etag)
+from utils.export import export_response
+from utils.filters import book_filters
+from utils.http import encode_json, json_response
+from utils.idempotency import idempotent
+from utils.importer import READ_ERRORS, import_books, open_text
+from utils.item_cache import get_item_cache
+from utils.pagination import decode_cursor, keyset_page, next_link, parse_limit, parse_sort
+from utils.response_cache import cached_response
+from utils.rows import BOOK_TABLE, book_columns
+from utils.search import search_books
+from utils.single_flight import coalesced
+from utils.snapshot import catalog_snapshot
+from utils.streaming import NDJSON, stream_response, wants_ndjson, wants_stream
+from utils.suggest import suggest_index
+from utils.write_behind import write_behind
+
+BOOK_COLUMNS = (Book.id, Book.title, Book.author, Book.version)
 
 book_schema = BookSchema()
 books_schema = BookSchema(many=True)
+dump_book = get_dumper()
+dump_books = get_dumper(many=True)
+
+def duplicate_book():
+    db.session.rollback()
+    return {"error": "A book with this title and author already exists"}, 409
+
+def load_many(json_data):
+    # Returns (valid rows, per-index errors) for a list payload.
+    try:
+        return books_schema.load(json_data), {}
+    except ValidationError as err:
+        # messages are keyed by item index; valid_data keeps the
+        # positions, so invalid items can be dropped by index
+        errors = err.messages if isinstance(err.messages, dict) else {"_schema": err.messages}
+        return [row for i, row in enumerate(err.valid_data or []) if i not in errors], errors
+
+def wants_async(request):
+    return ("respond-async" in request.headers.get("Prefer", "")
+            or request.args.get("async", "").lower() in ("1", "true", "yes"))
+
+def parse_selection(json_data):
+    # Bulk PATCH/DELETE body: {"ids": [...]} or {"filter": {"author": ...,
+    # "title_prefix": ...}}. Returns (ids, clauses).
+    ids = json_data.get("ids")
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValueError("ids must be a list of integers")
+        return sorted(set(ids)), []
+    filters = json_data.get("filter") or {}
+    if not isinstance(filters, dict):
+        raise ValueError("filter must be an object")
+    for name in ("author", "title_prefix"):
+        if filters.get(name) is not None and not isinstance(filters[name], str):
+            raise ValueError("filter.%s must be a string" % name)
+    clauses = book_filters(Book, filters)
+    if not clauses:
+        raise ValueError("Provide ids or a filter with author and/or title_prefix")
+    return None, clauses
 
 class BookListResource(Resource):
+    @coalesced
+    @cached_response()
     def get(self):
-        books = Book.query.all()
-        return books_schema.dump(books), 200
+        try:
+            fields = parse_fields(request.args.get("fields"))
+        except ValueError as err:
+            return {"error": str(err)}, 400
+        dump = get_dumper(fields, many=True)
+        filters = book_filters(BOOK_TABLE.c, request.args)
+
+        if wants_stream(request):
+            ndjson = wants_ndjson(request)
+            version, last_modified = catalog_stamp(db.session)
+            etag = weak_etag(request.full_path, ndjson, version)
+            cached = not_modified(etag, last_modified)
+            if cached:
+                return cached
+            if not filters and not fields:
+                response = catalog_snapshot.response(version, ndjson)
+                if response is not None:
+                    response.headers.update(validators(etag, last_modified))
+                    return response
+
+            statement = db.select(*book_columns(fields)).where(*filters).order_by(BOOK_TABLE.c.id)
+            response = stream_response(db.session, statement, dump, ndjson,
+                                       current_app.config["BOOKS_STREAM_BATCH_SIZE"])
+            response.headers.update(validators(etag, last_modified))
+            return response
+
+        try:
+            sort, descending = parse_sort(request.args.get("sort"))
+            limit = parse_limit(request.args.get("limit"),
+                                current_app.config["BOOKS_DEFAULT_PAGE_SIZE"],
+                                current_app.config["BOOKS_MAX_PAGE_SIZE"])
+            after = request.args.get("after")
+            if after is not None:
+                after = decode_cursor(after, sort)
+            # the sort column and id are needed to build the next cursor,
+            # version for the validator
+            statement = db.select(*book_columns(fields, (sort, "id", "version"))).where(*filters)
+            books, next_cursor = keyset_page(db.session, statement, BOOK_TABLE.c, sort, descending, after, limit)
+        except ValueError as err:
+            return {"error": str(err)}, 400
+
+        # the page's validator comes from the rows already fetched, so a
+        # matching If-None-Match skips serialization entirely. No
+        # Last-Modified: a delete removes a row without moving any date the
+        # page could report, so If-Modified-Since alone would answer 304.
+        etag = weak_etag(request.full_path, [(book.id, book.version) for book in books])
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        headers = validators(etag)
+        if next_cursor:
+            headers["Link"] = next_link(request.base_url, request.args, next_cursor)
+            headers["X-Next-Cursor"] = next_cursor
+        return dump(books), 200, headers
 
+    @idempotent
     def post(self):
         json_data = request.get_json()
         if not json_data:
             return {"error": "No input provided"}, 400
+        if isinstance(json_data, list):
+            return self.post_many(json_data)
 
         try:
             book_data = book_schema.load(json_data)
         except Exception as err:
             return {"error": str(err)}, 422
 
-        book = Book(**book_data)
-        db.session.add(book)
+        if current_app.config["BOOKS_ASYNC_WRITES"] and wants_async(request):
+            job_id = write_behind.submit(current_app._get_current_object(), book_data)
+            if job_id is None:
+                return {"error": "Write queue is full, retry later"}, 503, {"Retry-After": "1"}
+            status_url = url_for("bookjobresource", job_id=job_id)
+            return {"job": job_id, "status_url": status_url}, 202, {"Location": status_url}
+
+        # INSERT ... RETURNING gives us the row back, so nothing has to be
+        # re-read after the commit
+        try:
+            row = db.session.execute(db.insert(Book).values(**book_data).returning(*BOOK_COLUMNS)).one()
+        except IntegrityError:
+            return duplicate_book()
+        record_change(db.session, upserted=[row._asdict()])
+        db.session.commit()
+        return dump_book(row), 201, {"ETag": version_etag(row.version)}
+
+    def post_many(self, json_data):
+        rows, errors = load_many(json_data)
+        if not rows:
+            return {"error": "No valid books provided", "errors": errors}, 422
+
+        batch_size = current_app.config["BOOKS_BULK_BATCH_SIZE"]
+        if not UNIQUE_NATURAL_KEY:
+            ids = insert_books(db.session, rows, batch_size)
+            db.session.commit()
+            return {"created": ids, "errors": errors}, 201
+
+        # duplicates are reported per item, like validation errors
+        ids = insert_new_books(db.session, rows, batch_size)
+        db.session.commit()
+        positions = [i for i in range(len(json_data)) if i not in errors]
+        for position, book_id in zip(positions, ids):
+            if book_id is None:
+                errors[position] = {"_schema": ["A book with this title and author already exists"]}
+        created = [book_id for book_id in ids if book_id is not None]
+        if not created:
+            return {"error": "No books created", "errors": errors}, 409
+        return {"created": created, "errors": errors}, 201
+
+    @idempotent
+    def patch(self):
+        json_data = request.get_json()
+        if not isinstance(json_data, dict):
+            return {"error": "No input provided"}, 400
+        try:
+            ids, clauses = parse_selection(json_data)
+        except ValueError as err:
+            return {"error": str(err)}, 400
+        try:
+            values = book_schema.load(json_data.get("set") or {}, partial=True)
+        except ValidationError as err:
+            return {"error": str(err)}, 422
+        if not values:
+            return {"error": "set must contain title and/or author"}, 400
+
+        if json_data.get("dry_run"):
+            return {"matched": count_matching(db.session, ids, clauses, values), "dry_run": True}, 200
+        try:
+            updated = bulk_update(db.session, ids, clauses, values, current_app.config["BOOKS_BULK_BATCH_SIZE"])
+        except IntegrityError:
+            # earlier chunks are already committed
+            return duplicate_book()
+        return {"updated": updated}, 200
+
+    @idempotent
+    def delete(self):
+        json_data = request.get_json(silent=True)
+        if not isinstance(json_data, dict):
+            return {"error": "No input provided"}, 400
+        try:
+            ids, clauses = parse_selection(json_data)
+        except ValueError as err:
+            return {"error": str(err)}, 400
+
+        if json_data.get("dry_run"):
+            return {"matched": count_matching(db.session, ids, clauses), "dry_run": True}, 200
+        deleted = bulk_delete(db.session, ids, clauses, current_app.config["BOOKS_BULK_BATCH_SIZE"])
+        return {"deleted": deleted}, 200
+
+class BookExportResource(Resource):
+    def get(self):
+        fmt = request.args.get("format", "csv")
+        if fmt not in ("csv", "ndjson"):
+            return {"error": "format must be csv or ndjson"}, 400
+        compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+        return export_response(db.session, db.engine, fmt, compress,
+                               current_app.config["BOOKS_EXPORT_CHUNK_SIZE"],
+                               current_app.config["BOOKS_STREAM_BATCH_SIZE"])
+
+class BookImportResource(Resource):
+    def post(self):
+        fmt = request.args.get("format") or {"text/csv": "csv", NDJSON: "ndjson"}.get(request.mimetype)
+        if fmt not in ("csv", "ndjson"):
+            return {"error": "Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson"}, 415
+        compressed = request.content_encoding == "gzip" or request.args.get("gzip", "").lower() in ("1", "true", "yes")
+
+        # request.stream is read incrementally; the upload is never buffered
+        try:
+            report = import_books(db.session, open_text(request.stream, compressed), fmt, book_schema,
+                                  current_app.config["BOOKS_BULK_BATCH_SIZE"])
+        except READ_ERRORS as err:
+            db.session.rollback()
+            return {"error": "Could not read upload: %s" % err}, 400
+        except IntegrityError:
+            return duplicate_book()
+        return report.to_dict(), 201
+
+class BookUpsertResource(Resource):
+    @idempotent
+    def post(self):
+        if not UNIQUE_NATURAL_KEY:
+            return {"error": "Upsert needs BOOKS_UNIQUE_NATURAL_KEY enabled"}, 501
+        on_conflict = request.args.get("on_conflict", "update")
+        if on_conflict not in ("update", "ignore"):
+            return {"error": "on_conflict must be update or ignore"}, 400
+        json_data = request.get_json()
+        if not json_data:
+            return {"error": "No input provided"}, 400
+
+        batch_size = current_app.config["BOOKS_BULK_BATCH_SIZE"]
+        if isinstance(json_data, list):
+            rows, errors = load_many(json_data)
+            if not rows:
+                return {"error": "No valid books provided", "errors": errors}, 422
+            books = upsert_books(db.session, rows, on_conflict, batch_size)
+            db.session.commit()
+            return {"books": dump_books(books), "errors": errors}, 200
+
+        try:
+            book_data = book_schema.load(json_data)
+        except ValidationError as err:
+            return {"error": str(err)}, 422
+        books = upsert_books(db.session, [book_data], on_conflict, batch_size)
         db.session.commit()
-        return book_schema.dump(book), 201
+        if not books:
+            # on_conflict=ignore and the book already exists
+            return {"message": "Book already exists"}, 200
+        return dump_book(books[0]), 200
+
+class BookSearchResource(Resource):
+    @coalesced
+    @cached_response()
+    def get(self):
+        q = request.args.get("q", "").strip()
+        if not q:
+            return {"error": "q is required"}, 400
+
+        try:
+            dump = get_dumper(parse_fields(request.args.get("fields")), many=True)
+            limit = parse_limit(request.args.get("limit"),
+                                current_app.config["BOOKS_SEARCH_PAGE_SIZE"],
+                                current_app.config["BOOKS_MAX_PAGE_SIZE"])
+            after = request.args.get("after")
+            if after is not None:
+                after = decode_cursor(after, "rank")
+            fuzzy = request.args.get("fuzzy", "").lower() in ("1", "true", "yes")
+            threshold = request.args.get("threshold", "")
+            try:
+                # type=float would quietly fall back to the default on bad input
+                threshold = float(threshold) if threshold else current_app.config["BOOKS_FUZZY_THRESHOLD"]
+            except ValueError:
+                threshold = None
+            if threshold is None or not 0 < threshold <= 1:
+                raise ValueError("threshold must be a number between 0 and 1")
+            rows, next_cursor = search_books(db.session, q, limit, after, fuzzy=fuzzy, threshold=threshold,
+                                             candidates=current_app.config["BOOKS_FUZZY_MAX_CANDIDATES"])
+        except ValueError as err:
+            return {"error": str(err)}, 400
+
+        etag = weak_etag(request.full_path, [tuple(row) for row in rows])
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        headers = validators(etag)
+        if next_cursor:
+            headers["Link"] = next_link(request.base_url, request.args, next_cursor)
+            headers["X-Next-Cursor"] = next_cursor
+        return dump(rows), 200, headers
+
+class BookSuggestResource(Resource):
+    def get(self):
+        prefix = request.args.get("prefix", "")
+        if not prefix.strip():
+            return {"error": "prefix is required"}, 400
+        try:
+            limit = parse_limit(request.args.get("limit"), 10, current_app.config["BOOKS_SUGGEST_MAX_RESULTS"])
+        except ValueError as err:
+            return {"error": str(err)}, 400
+
+        if not suggest_index.ready:
+            # built in the background, never on the request path
+            suggest_index.schedule(current_app._get_current_object())
+            return {"error": "Suggestions are still loading"}, 503, {"Retry-After": "1"}
+        return suggest_index.suggest(prefix, limit), 200
+
+class BookJobResource(Resource):
+    def get(self, job_id):
+        job = write_behind.job(current_app._get_current_object(), job_id)
+        if job is None:
+            return {"error": "Job not found"}, 404
+        return dict(job, job=job_id), 200
 
 class BookResource(Resource):
-    def put(self, book_id):
-        book = Book.query.get(book_id)
-        if not book:
+    @coalesced
+    def get(self, book_id):
+        try:
+            fields = parse_fields(request.args.get("fields"))
+        except ValueError as err:
+            return {"error": str(err)}, 400
+        if fields:
+            return self.get_fields(book_id, fields)
+
+        item_cache = get_item_cache()
+        entry = item_cache.get(book_id)
+        if entry is None:
+            epoch = item_cache.epoch
+            row = db.session.execute(db.select(*book_columns(extra=("version", "updated_at")))
+                                     .where(BOOK_TABLE.c.id == book_id)).first()
+            if row is None:
+                return {"error": "Book not found"}, 404
+            entry = (encode_json(dump_book(row)), version_etag(row.version), row.updated_at)
+            item_cache.put(book_id, entry, epoch, current_app.config["BOOKS_ITEM_CACHE_SIZE"],
+                           current_app.config["BOOKS_ITEM_CACHE_TTL"])
+
+        body, etag, last_modified = entry
+        return not_modified(etag, last_modified) or json_response(body, headers=validators(etag, last_modified))
+
+    def get_fields(self, book_id, fields):
+        # sparse representations skip the cache and read only their columns
+        row = db.session.execute(db.select(*book_columns(fields, ("id", "version", "updated_at")))
+                                 .where(BOOK_TABLE.c.id == book_id)).first()
+        if row is None:
             return {"error": "Book not found"}, 404
+        etag = weak_etag(request.full_path, row.version)
+        cached = not_modified(etag, row.updated_at)
+        if cached:
+            return cached
+        return get_dumper(fields)(row), 200, validators(etag, row.updated_at)
 
+    # Every write is one statement plus the commit: the WHERE clause does the
+    # existence check (and the If-Match version check) and RETURNING hands
+    # back the row. Only when nothing comes back is the row read, to tell
+    # 404, 412 and "already up to date" apart.
+
+    def put(self, book_id):
         data = request.get_json()
-        book.title = data.get("title", book.title)
-        book.author = data.get("author", book.author)
+        if data is None:
+            return {"error": "No input provided"}, 400
+        try:
+            changes = book_schema.load(data, partial=True, unknown=EXCLUDE)
+        except ValidationError as err:
+            return {"error": str(err)}, 422
+        versions = if_match_versions()
+
+        row = None
+        if changes:
+            # rows whose values already match are not rewritten at all
+            where = [Book.id == book_id, or_(*(getattr(Book, k) != v for k, v in changes.items()))]
+            if versions not in (None, "*"):
+                where.append(Book.version.in_(versions))
+            statement = (db.update(Book).where(*where)
+                         .values(version=Book.version + 1, **changes)
+                         .returning(*BOOK_COLUMNS))
+            try:
+                row = db.session.execute(statement).first()
+            except IntegrityError:
+                return duplicate_book()
+        if row is None:
+            row = db.session.execute(db.select(*BOOK_COLUMNS).where(Book.id == book_id)).first()
+            if row is None:
+                return {"error": "Book not found"}, 404
+            if not version_matches(versions, row.version):
+                return {"error": "Book was modified by another request"}, 412
+            return {"message": "Book updated", "book": dump_book(row)}, 200, {"ETag": version_etag(row.version)}
+
+        record_change(db.session, upserted=[row._asdict()])
         db.session.commit()
-        return {"message": "Book updated"}
+        return {"message": "Book updated", "book": dump_book(row)}, 200, {"ETag": version_etag(row.version)}
+
+    def patch(self, book_id):
+        return self.put(book_id)
 
     def delete(self, book_id):
-        book = Book.query.get(book_id)
-        if not book:
-            return {"error": "Book not found"}, 404
+        versions = if_match_versions()
+        where = [Book.id == book_id]
+        if versions not in (None, "*"):
+            where.append(Book.version.in_(versions))
+        row = db.session.execute(db.delete(Book).where(*where).returning(Book.id)).first()
+        if row is None:
+            # without a version condition nothing matched because the row is gone
+            if versions in (None, "*") or db.session.execute(
+                    db.select(Book.id).where(Book.id == book_id)).first() is None:
+                return {"error": "Book not found"}, 404
+            return {"error": "Book was modified by another request"}, 412
 
-        db.session.delete(book)
+        record_change(db.session, deleted=[book_id])
         db.session.commit()
         return {"message": "Book deleted"}
@@ -0,0 +1,20 @@
+from flask_restful import Resource
+from utils.idempotency import idempotency_store
+from utils.item_cache import get_item_cache
+from utils.response_cache import cache_stats
+from utils.single_flight import single_flight
+from utils.snapshot import catalog_snapshot
+from utils.suggest import suggest_index
+from utils.write_behind import write_behind
+
+class StatsResource(Resource):
+    def get(self):
+        return {
+            "item_cache": get_item_cache().stats(),
+            "response_cache": cache_stats(),
+            "single_flight": single_flight.stats(),
+            "snapshot": catalog_snapshot.stats(),
+            "suggest": suggest_index.stats(),
+            "idempotency": idempotency_store.stats(),
+            "write_behind": write_behind.stats(),
+        }, 200
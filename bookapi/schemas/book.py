@@ -1,5 +1,8 @@
+from functools import lru_cache
+
 from flask_marshmallow import Marshmallow
 from models.book import Book
+from schemas.fast_dump import compile_dump
 
 ma = Marshmallow()
 
@@ -10,3 +13,31 @@ class BookSchema(ma.SQLAlchemySchema):
     id = ma.auto_field(dump_only=True)
     title = ma.Str(required=True, validate=lambda t: len(t) > 0)
     author = ma.Str(required=True, validate=lambda a: len(a) > 0)
+
+
+BOOK_FIELDS = ("id", "title", "author")
+
+
+def parse_fields(value):
+    # ?fields=id,title -> ("id", "title"), kept in schema order so equal
+    # field sets share one cached schema
+    if not value:
+        return None
+    requested = {f.strip() for f in value.split(",") if f.strip()}
+    unknown = requested.difference(BOOK_FIELDS)
+    if unknown:
+        raise ValueError("unknown fields: %s" % ", ".join(sorted(unknown)))
+    if not requested:
+        return None
+    return tuple(f for f in BOOK_FIELDS if f in requested)
+
+
+@lru_cache(maxsize=None)
+def get_schema(fields=None, many=False):
+    return BookSchema(only=fields, many=many)
+
+
+@lru_cache(maxsize=None)
+def get_dumper(fields=None, many=False):
+    # get_schema(...).dump, compiled; see schemas/fast_dump.py
+    return compile_dump(get_schema(fields, many))
@@ -0,0 +1,69 @@
+from keyword import iskeyword
+
+from marshmallow import fields, missing
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from marshmallow.utils import ensure_text_type
+
+
+def _fast_value(field, var):
+    # expression giving what field._serialize would return for var, or None
+    # when the field type has no compiled form
+    if type(field) is fields.Integer and not field.as_string:
+        return "None if %s is None else int(%s)" % (var, var)
+    if type(field) is fields.String:
+        return "%s if %s.__class__ is str else (None if %s is None else _text(%s))" % (var, var, var, var)
+    return None
+
+
+def compile_dump(schema):
+    # Builds a drop-in for schema.dump specialized to the schema's dump
+    # fields: plain attribute reads and inline conversions instead of
+    # marshmallow's per-field serialize/get_value dispatch. Fields without a
+    # compiled form go through their own serialize(); schemas with dump
+    # hooks, and objects read by key or missing an attribute (dicts, None),
+    # are handed to schema.dump, so the output is always the same.
+    if schema._hooks[PRE_DUMP] or schema._hooks[POST_DUMP] or schema.dict_class is not dict:
+        return schema.dump
+
+    namespace = {"_text": ensure_text_type, "missing": missing, "get_attribute": schema.get_attribute}
+    lines = []
+    items = []
+    for index, (name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key if field.data_key is not None else name
+        attribute = field.attribute or name
+        var = "v%d" % index
+        value = _fast_value(field, var)
+        if value is not None and attribute.isidentifier() and not iskeyword(attribute):
+            lines.append("    %s = obj.%s" % (var, attribute))
+            items.append((key, value, None))
+        else:
+            namespace["field_%d" % index] = field
+            lines.append("    %s = field_%d.serialize(%r, obj, accessor=get_attribute)" % (var, index, name))
+            items.append((key, var, var))
+
+    if any(check for _, _, check in items):
+        lines.append("    ret = {}")
+        for key, value, check in items:
+            if check:
+                lines.append("    if %s is not missing:" % check)
+                lines.append("        ret[%r] = %s" % (key, value))
+            else:
+                lines.append("    ret[%r] = %s" % (key, value))
+        lines.append("    return ret")
+    else:
+        lines.append("    return {%s}" % ", ".join("%r: %s" % (key, value) for key, value, _ in items))
+    source = "def dump_one(obj):\n" + "\n".join(lines)
+    exec(source, namespace)
+    dump_one = namespace["dump_one"]
+
+    def dump(obj, *, many=None):
+        many = schema.many if many is None else many
+        try:
+            if many and obj is not None:
+                return [dump_one(item) for item in obj]
+            return dump_one(obj)
+        except AttributeError:
+            return schema.dump(obj, many=many)
+
+    dump.source = source
+    return dump
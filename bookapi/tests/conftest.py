@@ -0,0 +1,35 @@
+import os
+import sys
+
+# the app imports its modules from the bookapi directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest  # noqa: E402
+
+from config import Config  # noqa: E402
+
+# tests build the suggest index when they need it: a startup build would
+# share the in-memory database with the fixtures' drop_all
+Config.BOOKS_SUGGEST_PRELOAD = False
+
+
+@pytest.fixture
+def app(tmp_path):
+    from app import app
+    from models.book import db
+    from utils import response_cache
+
+    app.config["TESTING"] = True
+    app.config["BOOKS_SNAPSHOT_DIR"] = str(tmp_path / "snapshot")
+    # the memory:// response cache is per process and would outlive the tables
+    response_cache._caches.clear()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,60 @@
+import socketserver
+import threading
+import time
+
+
+class RespStub(socketserver.ThreadingTCPServer):
+    # In-process stand-in for Redis: speaks enough RESP2 for RedisBackend
+    # (SELECT, GET, SET key value PX ms, DEL, INCR) and keeps data in a dict.
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.data = {}
+        self.commands = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return "redis://127.0.0.1:%d/0" % self.server_address[1]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.server.commands.append(args)
+            self.wfile.write(self._reply(args[0].upper(), args[1:]))
+
+    def _reply(self, command, args):
+        data = self.server.data
+        if command == b"SELECT":
+            return b"+OK\r\n"
+        if command == b"GET":
+            value, expires = data.get(args[0], (None, None))
+            if value is None or (expires is not None and expires <= time.monotonic()):
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b"SET":
+            data[args[0]] = (args[1], time.monotonic() + int(args[3]) / 1000)
+            return b"+OK\r\n"
+        if command == b"DEL":
+            return b":%d\r\n" % (data.pop(args[0], None) is not None)
+        if command == b"INCR":
+            value = int(data.get(args[0], (b"0", None))[0]) + 1
+            data[args[0]] = (str(value).encode(), None)
+            return b":%d\r\n" % value
+        return b"-ERR unknown command\r\n"
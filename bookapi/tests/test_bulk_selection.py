@@ -0,0 +1,27 @@
+import pytest
+
+
+@pytest.mark.parametrize("method", ["patch", "delete"])
+@pytest.mark.parametrize("body, error", [
+    ({"filter": "x"}, "filter must be an object"),
+    ({"filter": ["author"]}, "filter must be an object"),
+    ({"filter": {"title_prefix": 5}}, "filter.title_prefix must be a string"),
+    ({"filter": {"author": {"$ne": ""}}}, "filter.author must be a string"),
+    ({"filter": {}}, "Provide ids or a filter with author and/or title_prefix"),
+    ({"ids": "1"}, "ids must be a list of integers"),
+])
+def test_malformed_selection_is_rejected(client, method, body, error):
+    client.post("/books", json={"title": "a", "author": "x"})
+    body = dict(body, set={"title": "b"})
+    response = getattr(client, method)("/books", json=body)
+    assert response.status_code == 400
+    assert response.json == {"error": error}
+    assert client.get("/books/1").json["title"] == "a"
+
+
+def test_filter_selection(client):
+    client.post("/books", json=[{"title": "Alpha", "author": "x"}, {"title": "beta", "author": "x"},
+                                {"title": "alps", "author": "y"}])
+    response = client.patch("/books", json={"filter": {"author": "x", "title_prefix": "al"}, "set": {"author": "z"}})
+    assert response.status_code == 200
+    assert [book["author"] for book in client.get("/books").json] == ["z", "x", "y"]
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from resp_stub import RespStub
+from utils.cache_backends import MemoryBackend, RedisBackend, SQLiteBackend, create_backend
+
+
+@pytest.fixture
+def stub():
+    server = RespStub()
+    yield server
+    server.close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return create_backend("memory://", 10)
+    if request.param == "sqlite":
+        return create_backend("sqlite:///%s" % (tmp_path / "cache.db"), 10)
+    server = RespStub()
+    request.addfinalizer(server.close)
+    return create_backend(server.url, 10)
+
+
+def test_create_backend_schemes(tmp_path):
+    assert isinstance(create_backend("memory://", 10), MemoryBackend)
+    assert isinstance(create_backend("sqlite:///%s" % (tmp_path / "c.db"), 10), SQLiteBackend)
+    assert isinstance(create_backend("redis://127.0.0.1:1/2", 10), RedisBackend)
+    with pytest.raises(ValueError):
+        create_backend("memcached://localhost", 10)
+
+
+def test_set_get_delete(backend):
+    assert backend.get("k") is None
+    backend.set("k", b"value\n\x00bytes", 30)
+    assert backend.get("k") == b"value\n\x00bytes"
+    backend.set("k", b"other", 30)
+    assert backend.get("k") == b"other"
+    backend.delete("k")
+    assert backend.get("k") is None
+
+
+def test_entries_expire(backend):
+    backend.set("k", b"v", 0.05)
+    time.sleep(0.1)
+    assert backend.get("k") is None
+
+
+def test_tag_versions(backend):
+    assert backend.tag_version("books") == 0
+    backend.bump_tag("books")
+    backend.bump_tag("books")
+    assert backend.tag_version("books") == 2
+    assert backend.tag_version("other") == 0
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(2)
+    backend.set("a", b"1", 30)
+    backend.set("b", b"2", 30)
+    backend.get("a")
+    backend.set("c", b"3", 30)
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1"
+    assert backend.get("c") == b"3"
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    first = SQLiteBackend(str(tmp_path / "shared.db"), 10)
+    second = SQLiteBackend(str(tmp_path / "shared.db"), 10)
+    first.set("k", b"v", 30)
+    first.bump_tag("books")
+    assert second.get("k") == b"v"
+    assert second.tag_version("books") == 1
+
+
+def test_sqlite_backend_prunes_to_max_entries(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "pruned.db"), 5)
+    for index in range(SQLiteBackend.PRUNE_EVERY):
+        backend.set("k%d" % index, b"v", 30 + index)
+    count = backend._connect().execute("SELECT count(*) FROM cache_entries").fetchone()[0]
+    assert count == 5
+    assert backend.get("k%d" % (SQLiteBackend.PRUNE_EVERY - 1)) == b"v"
+
+
+def test_redis_backend_protocol(stub):
+    backend = RedisBackend("127.0.0.1", stub.server_address[1], db=3)
+    backend.set("k", b"v", 1.5)
+    assert stub.commands[0] == [b"SELECT", b"3"]
+    assert stub.commands[1] == [b"SET", b"bookapi:k", b"v", b"PX", b"1500"]
+    assert backend.get("k") == b"v"
+    backend.bump_tag("books")
+    assert stub.commands[-1] == [b"INCR", b"bookapi:tag:books"]
+
+
+def test_redis_backend_reconnects_once(stub):
+    backend = RedisBackend("127.0.0.1", stub.server_address[1])
+    backend.set("k", b"v", 30)
+    backend._socket.close()
+    assert backend.get("k") == b"v"
+
+
+def test_redis_backend_unreachable():
+    backend = RedisBackend("127.0.0.1", 1, timeout=0.2)
+    with pytest.raises(OSError):
+        backend.get("k")
@@ -0,0 +1,150 @@
+import pytest
+
+
+def test_page_has_no_last_modified(client):
+    for title in ("a", "b"):
+        client.post("/books", json={"title": title, "author": "x"})
+    response = client.get("/books")
+    assert response.headers["ETag"]
+    assert "Last-Modified" not in response.headers
+
+    assert client.delete("/books/2").status_code == 200
+    since = client.get("/books", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert since.status_code == 200
+    assert [book["id"] for book in since.json] == [1]
+
+
+def test_page_etag_changes_on_delete(client):
+    for title in ("a", "b"):
+        client.post("/books", json={"title": title, "author": "x"})
+    etag = client.get("/books").headers["ETag"]
+    assert client.get("/books", headers={"If-None-Match": etag}).status_code == 304
+    client.delete("/books/2")
+    assert client.get("/books", headers={"If-None-Match": etag}).status_code == 200
+
+
+def catalog_version(app):
+    from models.book import db
+    from utils.conditional import catalog_stamp
+    with app.app_context():
+        return catalog_stamp(db.session)[0]
+
+
+def test_every_write_path_bumps_catalog_version(app, client):
+    versions = [catalog_version(app)]
+    client.post("/books", json={"title": "a", "author": "x"})
+    versions.append(catalog_version(app))
+    client.post("/books", json=[{"title": "b", "author": "x"}, {"title": "c", "author": "x"}])
+    versions.append(catalog_version(app))
+    client.patch("/books/1", json={"title": "A"})
+    versions.append(catalog_version(app))
+    client.delete("/books/3")
+    versions.append(catalog_version(app))
+    client.delete("/books", json={"ids": [2]})
+    versions.append(catalog_version(app))
+    assert versions == sorted(set(versions))
+
+    # failed writes and reads leave it alone
+    client.delete("/books/99")
+    client.get("/books")
+    assert catalog_version(app) == versions[-1]
+
+
+def test_stream_revalidates_after_delete(client):
+    for title in ("a", "b"):
+        client.post("/books", json={"title": title, "author": "x"})
+    response = client.get("/books?stream=1")
+    etag = response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+    assert client.get("/books?stream=1", headers={"If-None-Match": etag}).status_code == 304
+
+    client.delete("/books/2")
+    assert client.get("/books?stream=1", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/books?stream=1&author=x", headers={"If-None-Match": etag}).status_code == 200
+
+
+def record_statements(app):
+    from sqlalchemy import event
+    from models.book import db
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", listener)
+
+
+def test_delete_missing_book_without_if_match_is_one_statement(app, client):
+    statements, stop = record_statements(app)
+    try:
+        assert client.delete("/books/99").status_code == 404
+        assert client.delete("/books/99", headers={"If-Match": "*"}).status_code == 404
+    finally:
+        stop()
+    assert not [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+
+def test_delete_if_match(client):
+    client.post("/books", json={"title": "a", "author": "x"})
+    assert client.delete("/books/1", headers={"If-Match": '"7"'}).status_code == 412
+    assert client.delete("/books/2", headers={"If-Match": '"1"'}).status_code == 404
+    assert client.delete("/books/1", headers={"If-Match": '"1"'}).status_code == 200
+
+
+def test_writes_outside_the_app_bump_catalog_version(app, client):
+    from models.book import db
+    client.post("/books", json={"title": "a", "author": "x"})
+    versions = [catalog_version(app)]
+    for statement in ("INSERT INTO new_book (title, author) VALUES ('b', 'y')",
+                      "UPDATE new_book SET title = 'c' WHERE id = 2",
+                      "DELETE FROM new_book WHERE id = 2"):
+        with app.app_context():
+            db.session.execute(db.text(statement))
+            db.session.commit()
+        versions.append(catalog_version(app))
+    assert versions == sorted(set(versions))
+
+    with app.app_context():
+        db.session.execute(db.text("DELETE FROM new_book WHERE id = 99"))
+        db.session.commit()
+    assert catalog_version(app) == versions[-1]
+
+
+def test_rolled_back_write_leaves_catalog_version(app):
+    from models.book import db
+    version = catalog_version(app)
+    with app.app_context():
+        db.session.execute(db.text("INSERT INTO new_book (title, author) VALUES ('b', 'y')"))
+        db.session.rollback()
+    assert catalog_version(app) == version
+
+
+@pytest.mark.parametrize("method, body", [
+    ("delete", {"ids": [99]}),
+    ("delete", {"filter": {"author": "nobody"}}),
+    ("patch", {"ids": [99], "set": {"title": "b"}}),
+    ("patch", {"filter": {"author": "x"}, "set": {"title": "a"}}),
+])
+def test_bulk_writes_matching_nothing_leave_catalog_version(app, client, method, body):
+    from utils import changes
+    client.post("/books", json={"title": "a", "author": "x"})
+    version = catalog_version(app)
+    calls = []
+    changes._listeners.append(lambda *args: calls.append(args))
+    try:
+        response = getattr(client, method)("/books", json=body)
+    finally:
+        changes._listeners.pop()
+    assert response.status_code == 200
+    assert catalog_version(app) == version
+    assert calls == []
+
+
+def test_bulk_filter_commits_once_per_chunk(app, client, monkeypatch):
+    from models.book import db
+    client.post("/books", json=[{"title": str(i), "author": "x"} for i in range(5)])
+    app.config["BOOKS_BULK_BATCH_SIZE"] = 2
+    commits, commit = [], db.session.commit
+    monkeypatch.setattr(db.session, "commit", lambda: commits.append(commit()))
+    assert client.delete("/books", json={"filter": {"author": "x"}}).json == {"deleted": 5}
+    assert len(commits) == 3
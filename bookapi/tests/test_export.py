@@ -0,0 +1,77 @@
+import csv
+import io
+import threading
+
+import pytest
+
+from utils import export
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy_expert(self, sql, writer):
+        for row in self.rows:
+            writer.write(row)
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self.rows)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEngine:
+    def __init__(self, connect):
+        self._connect = connect
+
+    def raw_connection(self):
+        return self._connect()
+
+
+def test_copy_chunks_reslices_output():
+    connection = FakeConnection(["id,title\n", "1,a\n", "2,b\n"])
+    chunks = list(export._copy_chunks(FakeEngine(lambda: connection), "COPY", 4, False))
+    assert b"".join(chunks) == b"id,title\n1,a\n2,b\n"
+    assert all(len(chunk) == 4 for chunk in chunks[:-1])
+    assert connection.closed
+
+
+def test_connect_failure_reaches_the_response():
+    def connect():
+        raise OSError("database down")
+
+    chunks = export._copy_chunks(FakeEngine(connect), "COPY", 4, False)
+    with pytest.raises(OSError, match="database down"):
+        next(chunks)
+
+
+def test_dead_copy_thread_does_not_wedge_the_response(monkeypatch):
+    # a BaseException skips the thread's own error handling
+    def connect():
+        raise SystemExit()
+
+    monkeypatch.setattr(threading, "excepthook", lambda args: None)
+    chunks = export._copy_chunks(FakeEngine(connect), "COPY", 4, False)
+    with pytest.raises(RuntimeError, match="exited without finishing"):
+        next(chunks)
+
+
+def test_row_export_matches_copy_format(client):
+    client.post("/books", json=[{"title": 'a, "quoted"', "author": "x"}, {"title": "b", "author": "y"}])
+    response = client.get("/books/export?format=csv")
+    assert list(csv.reader(io.StringIO(response.data.decode()))) == [
+        ["id", "title", "author"], ["1", 'a, "quoted"', "x"], ["2", "b", "y"]]
@@ -0,0 +1,44 @@
+import pytest
+
+from models.book import Book, db
+from schemas.book import BOOK_FIELDS, get_dumper, get_schema
+from utils.rows import book_columns
+
+FIELD_SETS = [None, ("id",), ("title",), ("id", "author"), BOOK_FIELDS]
+
+
+@pytest.fixture
+def books(app):
+    with app.app_context():
+        db.session.execute(db.insert(Book), [{"title": "Té %d" % i, "author": "A %d" % i} for i in range(3)])
+        db.session.commit()
+        yield
+
+
+def sources():
+    statement = db.select(Book).order_by(Book.id)
+    yield "orm", db.session.scalars(statement).all()
+    yield "columns", db.session.execute(db.select(*book_columns()).order_by(Book.id)).all()
+    yield "orm columns", db.session.execute(db.select(Book.id, Book.title, Book.author).order_by(Book.id)).all()
+    yield "dicts", [{"id": 1, "title": "a", "author": "b"}, {"id": "2", "title": 5, "author": None}]
+
+
+@pytest.mark.parametrize("fields", FIELD_SETS)
+def test_matches_schema_dump(books, fields):
+    many, one = get_dumper(fields, many=True), get_dumper(fields)
+    schema = get_schema(fields, many=True)
+    for label, items in sources():
+        assert many(items) == schema.dump(items), label
+        assert one(items[0]) == schema.dump(items[0], many=False), label
+        assert many(items[0], many=False) == schema.dump(items[0], many=False), label
+
+
+@pytest.mark.parametrize("fields", FIELD_SETS)
+def test_matches_schema_dump_for_none_and_missing_values(fields):
+    schema = get_schema(fields, many=True)
+    dump = get_dumper(fields, many=True)
+    assert dump(None) == schema.dump(None)
+    assert get_dumper(fields)(None) == get_schema(fields).dump(None)
+    assert dump([{}]) == schema.dump([{}])
+    book = Book(title=None, author="x")
+    assert dump([book]) == schema.dump([book])
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from utils.idempotency import IdempotencyStore, idempotency_store
+
+
+@pytest.fixture(autouse=True)
+def clear_store(monkeypatch):
+    monkeypatch.setattr(idempotency_store, "_responses", type(idempotency_store._responses)())
+
+
+def test_replay_requires_same_query_string(client):
+    headers = {"Idempotency-Key": "k1"}
+    first = client.post("/books", json={"title": "a", "author": "x"}, headers=headers)
+    assert first.status_code == 201
+    replay = client.post("/books", json={"title": "a", "author": "x"}, headers=headers)
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json == first.json
+
+    other = client.post("/books?async=1", json={"title": "a", "author": "x"}, headers=headers)
+    assert other.status_code == 422
+    assert len(client.get("/books").json) == 1
+
+
+def run_in_thread(store, key, fn, results):
+    thread = threading.Thread(target=lambda: results.append(store.run(key, "f", fn, 60, 10, 5)))
+    thread.start()
+    return thread
+
+
+def test_waiter_runs_write_when_owner_raises():
+    store = IdempotencyStore()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def failing():
+        calls.append("owner")
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    def succeeding():
+        calls.append("waiter")
+        return {"id": 1}, 201
+
+    def owner():
+        with pytest.raises(RuntimeError):
+            store.run("k", "f", failing, 60, 10, 5)
+
+    results = []
+    owner_thread = threading.Thread(target=owner)
+    owner_thread.start()
+    started.wait(5)
+    waiter = run_in_thread(store, "k", succeeding, results)
+    # give the waiter time to block on the owner
+    time.sleep(0.05)
+    release.set()
+    owner_thread.join(5)
+    waiter.join(5)
+
+    assert calls == ["owner", "waiter"]
+    assert results == [({"id": 1}, 201, {})]
+    assert store.run("k", "f", succeeding, 60, 10, 5)[2] == {"Idempotent-Replayed": "true"}
+
+
+def test_waiter_times_out_while_owner_runs():
+    store = IdempotencyStore()
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return {}, 201
+
+    owner = threading.Thread(target=store.run, args=("k", "f", slow, 60, 10, 5))
+    owner.start()
+    started.wait(5)
+    assert store.run("k", "f", slow, 60, 10, 0.01)[1] == 409
+    release.set()
+    owner.join(5)
@@ -0,0 +1,77 @@
+import gzip
+import io
+
+import pytest
+
+from schemas.book import BookSchema
+from utils.importer import CopySource, ImportReport, copy_rows, open_text, read_records, validated_rows
+
+
+class QueryCanceled(Exception):
+    pass
+
+
+class FakeCursor:
+    # copy_expert the way psycopg2 reports a failing read(): as its own error
+    def __init__(self):
+        self.data = ""
+
+    def copy_expert(self, sql, source):
+        try:
+            while True:
+                chunk = source.read(8192)
+                if not chunk:
+                    return
+                self.data += chunk
+        except Exception as err:
+            raise QueryCanceled("error in .read() call: %s" % err)
+
+
+def copy_source(payload, compressed=False):
+    text = open_text(io.BytesIO(payload), compressed)
+    return CopySource(validated_rows(read_records(text, "csv"), BookSchema(), ImportReport(), 2), 2)
+
+
+def test_copy_rows_encodes_valid_rows():
+    cursor = FakeCursor()
+    copy_rows(cursor, "COPY", copy_source(b"title,author\na,x\n\"b, c\",z\n"))
+    assert cursor.data == "a,x\n\"b, c\",z\n"
+
+
+@pytest.mark.parametrize("payload, compressed, error", [
+    (b"title,author\n\xff\xfe,x\n", False, UnicodeDecodeError),
+    (b"not gzip", True, OSError),
+    (gzip.compress(b"title,author\n" + b"a,x\n" * 1000)[:-20], True, EOFError),
+])
+def test_copy_rows_reraises_read_errors(payload, compressed, error):
+    with pytest.raises(error):
+        copy_rows(FakeCursor(), "COPY", copy_source(payload, compressed))
+
+
+def test_copy_rows_keeps_database_errors():
+    class FailingCursor:
+        def copy_expert(self, sql, source):
+            raise QueryCanceled("statement timeout")
+
+    with pytest.raises(QueryCanceled):
+        copy_rows(FailingCursor(), "COPY", copy_source(b"title,author\na,x\n"))
+
+
+@pytest.mark.parametrize("body, headers", [
+    (b"title,author\n\xff,x\n", {}),
+    (b"not gzip", {"Content-Encoding": "gzip"}),
+])
+def test_unreadable_upload_is_rejected(client, body, headers):
+    response = client.post("/books/import", data=body, content_type="text/csv", headers=headers)
+    assert response.status_code == 400
+    assert response.json["error"].startswith("Could not read upload")
+    assert client.get("/books").json == []
+
+
+def test_cli_reports_unreadable_file(app, tmp_path):
+    path = tmp_path / "books.csv.gz"
+    path.write_bytes(b"not gzip")
+    result = app.test_cli_runner().invoke(args=["books", "import", str(path)])
+    assert result.exit_code == 1
+    assert "could not read" in result.output
+    assert result.exception is None or isinstance(result.exception, SystemExit)
@@ -0,0 +1,47 @@
+import time
+
+from utils import item_cache
+from utils.item_cache import ItemCache
+
+ENTRY = (b"{}", '"1"', None)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache = ItemCache()
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache.put(1, ENTRY, cache.epoch, 10, ttl=5)
+    now[0] = 104.9
+    assert cache.get(1) == ENTRY
+    now[0] = 105
+    assert cache.get(1) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_no_ttl_keeps_entries():
+    cache = ItemCache()
+    cache.put(1, ENTRY, cache.epoch, 10)
+    assert cache.get(1) == ENTRY
+
+
+def test_put_after_invalidation_is_refused():
+    cache = ItemCache()
+    epoch = cache.epoch
+    cache.apply({1: {}}, set(), False)
+    cache.put(1, ENTRY, epoch, 10, ttl=5)
+    assert cache.get(1) is None
+
+
+def test_another_workers_write_is_seen_after_ttl(app, client, monkeypatch):
+    # a write the change hook never saw, as when another worker handled it
+    monkeypatch.setattr(item_cache, "item_cache", ItemCache())
+    monkeypatch.setitem(app.config, "BOOKS_ITEM_CACHE_TTL", 0.05)
+    client.post("/books", json={"title": "a", "author": "x"})
+    assert client.get("/books/1").json["title"] == "a"
+    from models.book import db
+    with app.app_context():
+        db.session.execute(db.text("UPDATE new_book SET title = 'b' WHERE id = 1"))
+        db.session.commit()
+    assert client.get("/books/1").json["title"] == "a"
+    time.sleep(0.06)
+    assert client.get("/books/1").json["title"] == "b"
@@ -0,0 +1,57 @@
+
+import pytest
+
+import models.book
+import resources.book_resources
+import utils.importer
+
+
+def test_natural_key_is_off_by_default():
+    from config import Config
+    assert Config.BOOKS_UNIQUE_NATURAL_KEY is False
+    index = next(i for i in models.book.Book.__table__.indexes if i.name == "ix_new_book_author_title")
+    assert index.unique is False
+
+
+def test_duplicates_allowed_without_natural_key(client):
+    response = client.post("/books", json=[{"title": "t", "author": "a"}, {"title": "t", "author": "a"}])
+    assert response.status_code == 201
+    assert response.json["created"] == [1, 2]
+    assert client.post("/books:upsert", json={"title": "t", "author": "a"}).status_code == 501
+
+
+@pytest.fixture
+def natural_key(app, monkeypatch):
+    # the schema reads the flag once, so build a unique index for the test
+    from models.book import Book, db
+    for module in (models.book, resources.book_resources, utils.importer):
+        monkeypatch.setattr(module, "UNIQUE_NATURAL_KEY", True)
+    with app.app_context():
+        db.session.execute(db.text("DROP INDEX ix_new_book_author_title"))
+        db.session.execute(db.text("CREATE UNIQUE INDEX ix_new_book_author_title ON new_book (author, title)"))
+        db.session.commit()
+    return Book
+
+
+def test_bulk_create_reports_duplicates_per_item(client, natural_key):
+    client.post("/books", json={"title": "t", "author": "a"})
+    response = client.post("/books", json=[{"title": "t", "author": "a"}, {"title": "u", "author": "a"},
+                                           {"title": ""}, {"title": "u", "author": "a"}])
+    assert response.status_code == 201
+    assert response.json["created"] == [2]
+    assert set(response.json["errors"]) == {"0", "2", "3"}
+    assert "already exists" in response.json["errors"]["0"]["_schema"][0]
+
+    response = client.post("/books", json=[{"title": "t", "author": "a"}])
+    assert response.status_code == 409
+    assert "0" in response.json["errors"]
+
+
+def test_import_skips_duplicates(client, natural_key):
+    client.post("/books", json={"title": "t", "author": "a"})
+    body = "title,author\nt,a\nu,a\nu,a\n"
+    response = client.post("/books/import", data=body, content_type="text/csv")
+    assert response.status_code == 201
+    assert (response.json["imported"], response.json["rejected"], response.json["duplicates"]) == (1, 2, 2)
+    response = client.post("/books/import", data=body, content_type="text/csv")
+    assert (response.json["imported"], response.json["duplicates"]) == (0, 3)
@@ -0,0 +1,49 @@
+import pytest
+
+from utils.pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("sort, values", [
+    ("id", [3]),
+    ("title", ["Dune", 3]),
+    ("author", ["", 3]),
+    ("rank", [0.5, 3]),
+    ("rank", [-2, 3]),
+])
+def test_cursor_round_trip(sort, values):
+    assert decode_cursor(encode_cursor(sort, values), sort) == values
+
+
+@pytest.mark.parametrize("sort, values", [
+    ("id", []),
+    ("id", [3, 4]),
+    ("id", ["3"]),
+    ("id", [True]),
+    ("id", [3.5]),
+    ("id", [None]),
+    ("title", [3]),
+    ("title", ["Dune"]),
+    ("title", ["Dune", "3"]),
+    ("title", [["Dune"], 3]),
+    ("author", [{"$ne": 1}, 3]),
+    ("rank", ["0.5", 3]),
+    ("rank", [float("nan"), 3]),
+    ("rank", [0.5, 3.5]),
+])
+def test_malformed_cursor_is_rejected(sort, values):
+    with pytest.raises(ValueError, match="invalid cursor"):
+        decode_cursor(encode_cursor(sort, values), sort)
+
+
+@pytest.mark.parametrize("path, sort, values", [
+    ("/books?sort=title", "title", [{"a": 1}, 2]),
+    ("/books?sort=-author", "author", ["x"]),
+    ("/books?sort=id", "id", ["1"]),
+    ("/books/search?q=dune", "rank", ["high", 1]),
+    ("/books/search?q=dune&fuzzy=1", "rank", [0.5]),
+])
+def test_malformed_cursor_is_a_bad_request(client, path, sort, values):
+    client.post("/books", json={"title": "Dune", "author": "x"})
+    response = client.get("%s&after=%s" % (path, encode_cursor(sort, values)))
+    assert response.status_code == 400
+    assert response.json == {"error": "invalid cursor"}
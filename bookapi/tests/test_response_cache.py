@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from resources import book_resources
+from utils import response_cache
+from utils.cache_backends import MemoryBackend
+
+
+@pytest.fixture
+def cached_client(app, client):
+    app.config["BOOKS_CACHE_URL"] = "memory://"
+    response_cache._caches.clear()
+    client.post("/books", json=[{"title": "x", "author": "x"}, {"title": "y", "author": "x&fields=id"}])
+    return client
+
+
+def test_escaped_query_does_not_share_an_entry(cached_client):
+    first = cached_client.get("/books?author=x&fields=id")
+    assert first.headers["X-Cache"] == "MISS"
+    assert first.json == [{"id": 1}]
+
+    second = cached_client.get("/books?author=x%26fields%3Did")
+    assert second.headers["X-Cache"] == "MISS"
+    assert second.json == [{"id": 2, "title": "y", "author": "x&fields=id"}]
+
+
+def test_argument_order_shares_an_entry(cached_client):
+    assert cached_client.get("/books?sort=id&limit=1").headers["X-Cache"] == "MISS"
+    assert cached_client.get("/books?limit=1&sort=id").headers["X-Cache"] == "HIT"
+
+
+def test_writes_invalidate(cached_client):
+    cached_client.get("/books")
+    assert cached_client.get("/books").headers["X-Cache"] == "HIT"
+    cached_client.patch("/books/1", json={"title": "changed"})
+    response = cached_client.get("/books")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json[0]["title"] == "changed"
+
+
+def wait_for_refresh(cache):
+    deadline = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_stale_entry_is_served_while_it_refreshes(app, cached_client):
+    app.config.update(BOOKS_CACHE_TTL=0, BOOKS_CACHE_STALE_WHILE_REVALIDATE=60)
+    response_cache._caches.clear()
+    assert cached_client.get("/books").headers["X-Cache"] == "MISS"
+    cache = response_cache._caches["memory://"]
+
+    stale = cached_client.get("/books")
+    assert stale.headers["X-Cache"] == "STALE"
+    wait_for_refresh(cache)
+    assert cache.stats()["refreshes"] == 1
+    assert stale.json == cached_client.get("/books", headers={"Cache-Control": "no-cache"}).json
+
+
+def test_one_refresh_per_key(app):
+    cache = response_cache.ResponseCache(MemoryBackend(10), 0, 60, 0)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"ok": True}, 200
+
+    with app.test_request_context("/books"):
+        cache.refresh("k", "books", slow)
+        started.wait(5)
+        cache.refresh("k", "books", slow)
+        cache.refresh("k", "books", slow)
+        release.set()
+        wait_for_refresh(cache)
+        assert calls == [1]
+        assert cache.stats()["refreshes"] == 1
+        assert cache.lookup("k", 0)[0] == "stale"
+
+        # the key is free again once the refresh finished
+        cache.refresh("k", "books", slow)
+        wait_for_refresh(cache)
+        assert calls == [1, 1]
+
+
+def break_reads(monkeypatch):
+    def fail(*args, **kwargs):
+        raise OperationalError("SELECT", {}, Exception("database is down"))
+    monkeypatch.setattr(book_resources, "keyset_page", fail)
+
+
+def test_outdated_entry_is_served_when_the_database_fails(cached_client, monkeypatch):
+    body = cached_client.get("/books").json
+    cached_client.patch("/books/1", json={"title": "changed"})
+    break_reads(monkeypatch)
+    response = cached_client.get("/books")
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "STALE"
+    assert response.json == body
+    assert response_cache._caches["memory://"].stats()["served_on_error"] == 1
+
+
+def test_database_errors_propagate_without_a_usable_entry(app, cached_client, monkeypatch):
+    app.config.update(BOOKS_CACHE_TTL=0, BOOKS_CACHE_STALE_WHILE_REVALIDATE=0, BOOKS_CACHE_STALE_IF_ERROR=0)
+    response_cache._caches.clear()
+    cached_client.get("/books")
+    break_reads(monkeypatch)
+    with pytest.raises(OperationalError):
+        cached_client.get("/books")
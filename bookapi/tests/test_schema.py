@@ -0,0 +1,14 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from models.book import Book
+from utils.rows import book_columns
+
+
+def test_author_index_covers_the_paged_listing():
+    index = next(i for i in Book.__table__.indexes if i.name == "ix_new_book_author_title")
+    ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+    assert ddl.endswith("INCLUDE (id, version)")
+    # what BookListResource selects for a page sorted by title
+    covered = {column.name for column in index.columns} | set(index.dialect_options["postgresql"]["include"])
+    assert {column.name for column in book_columns(extra=("title", "id", "version"))} <= covered
@@ -0,0 +1,26 @@
+import pytest
+
+
+@pytest.mark.parametrize("threshold", ["abc", "0", "1.5", "nan", "-0.2"])
+def test_bad_threshold_is_rejected(client, threshold):
+    response = client.get("/books/search?q=dune&fuzzy=1&threshold=" + threshold)
+    assert response.status_code == 400
+    assert response.json == {"error": "threshold must be a number between 0 and 1"}
+
+
+@pytest.mark.parametrize("query", ["", "&threshold=", "&threshold=0.5", "&threshold=1"])
+def test_threshold_default_and_valid(client, query):
+    client.post("/books", json={"title": "Dune", "author": "Herbert"})
+    response = client.get("/books/search?q=dune" + query)
+    assert response.status_code == 200
+    assert [book["title"] for book in response.json] == ["Dune"]
+
+
+def test_fuzzy_ranks_the_closest_candidates(app, client):
+    app.config["BOOKS_FUZZY_MAX_CANDIDATES"] = 2
+    client.post("/books", json=[{"title": "Dune Messiah Children", "author": "x"},
+                                {"title": "Dune Messiah", "author": "x"},
+                                {"title": "Dunes", "author": "x"},
+                                {"title": "Dune", "author": "x"}])
+    response = client.get("/books/search?q=dune&fuzzy=1&threshold=0.1")
+    assert [book["title"] for book in response.json] == ["Dune", "Dunes"]
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from utils import item_cache
+from utils.shared_cache import SharedItemCache
+
+
+@pytest.fixture
+def shared(app, monkeypatch, tmp_path):
+    directory = tmp_path / "cache"
+    monkeypatch.setitem(app.config, "BOOKS_ITEM_CACHE", "shared")
+    monkeypatch.setitem(app.config, "BOOKS_SHARED_CACHE_PATH", str(directory / "items.cache"))
+    return directory
+
+
+def test_default_path_is_under_instance_path(app):
+    from config import Config
+    assert not os.path.isabs(Config.BOOKS_SHARED_CACHE_PATH)
+
+
+def test_entries_are_shared_and_invalidated(app, client, shared):
+    client.post("/books", json={"title": "a", "author": "x"})
+    assert client.get("/books/1").json["title"] == "a"
+    with app.app_context():
+        cache = item_cache.get_item_cache()
+        assert isinstance(cache, SharedItemCache)
+        assert cache.get(1) is not None
+    assert os.stat(shared).st_mode & 0o777 == 0o700
+
+    client.put("/books/1", json={"title": "b"})
+    assert client.get("/books/1").json["title"] == "b"
+
+
+def test_symlinked_file_is_refused(tmp_path):
+    target = tmp_path / "precious"
+    target.write_bytes(b"keep")
+    os.symlink(target, tmp_path / "items.cache")
+    with pytest.raises(OSError):
+        SharedItemCache(str(tmp_path / "items.cache"), 64, 256)
+    assert target.read_bytes() == b"keep"
+
+
+def test_directory_others_can_write_falls_back_to_lru(app, shared):
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    with app.app_context():
+        assert item_cache.get_item_cache() is item_cache.item_cache
+        assert app.config["BOOKS_ITEM_CACHE"] == "lru"
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from utils.single_flight import SingleFlight
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def start_leader(flight, fn, results):
+    thread = threading.Thread(target=lambda: results.append(flight.run("k", fn, 5)))
+    thread.start()
+    return thread
+
+
+def blocking(calls, started, release, result="leader"):
+    def fn():
+        calls.append(result)
+        started.set()
+        release.wait(5)
+        return result
+    return fn
+
+
+def run_failing(flight, fn):
+    try:
+        flight.run("k", fn, 5)
+    except RuntimeError:
+        return "raised"
+
+
+def test_followers_share_the_leader_result():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+    leader = start_leader(flight, blocking(calls, started, release), results)
+    started.wait(5)
+    followers = [start_leader(flight, lambda: calls.append("follower"), results) for _ in range(3)]
+    wait_until(lambda: flight.stats()["coalesced"] == 3)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == ["leader"]
+    assert sorted(results) == [("leader", False)] + [("leader", True)] * 3
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 3, "fallbacks": 0}
+
+
+def test_follower_runs_the_read_when_the_leader_fails():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def failing():
+        blocking(calls, started, release)()
+        raise RuntimeError("boom")
+
+    leader = threading.Thread(target=lambda: results.append(run_failing(flight, failing)))
+    leader.start()
+    started.wait(5)
+    follower = start_leader(flight, lambda: "follower", results)
+    wait_until(lambda: flight.stats()["coalesced"] == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert sorted(results, key=str) == [("follower", False), "raised"]
+    assert flight.stats()["fallbacks"] == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_follower_stops_waiting_after_the_timeout():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+    leader = start_leader(flight, blocking(calls, started, release), results)
+    started.wait(5)
+
+    assert flight.run("k", lambda: "follower", 0.01) == ("follower", False)
+    assert flight.stats()["fallbacks"] == 1
+    release.set()
+    leader.join(5)
+    assert results == [("leader", False)]
+
+
+def test_a_new_read_runs_once_the_leader_is_done():
+    flight = SingleFlight()
+    assert flight.run("k", lambda: 1, 5) == (1, False)
+    assert flight.run("k", lambda: 2, 5) == (2, False)
+    assert flight.run("other", lambda: 3, 5) == (3, False)
+    assert flight.stats()["leaders"] == 3
@@ -0,0 +1,108 @@
+import os
+import stat
+
+import pytest
+
+from utils.snapshot import CatalogSnapshot, catalog_snapshot
+
+
+@pytest.fixture
+def snapshot(app, monkeypatch, tmp_path):
+    # builds are run by hand; the debounce keeps the background thread out
+    directory = tmp_path / "snapshot"
+    monkeypatch.setitem(app.config, "BOOKS_SNAPSHOT_DIR", str(directory))
+    monkeypatch.setitem(app.config, "BOOKS_SNAPSHOT_DEBOUNCE_MS", 60000)
+    monkeypatch.setattr(catalog_snapshot, "_meta", (None, None))
+    reads = []
+    read_meta = CatalogSnapshot._read_meta
+    monkeypatch.setattr(CatalogSnapshot, "_read_meta", staticmethod(lambda d: reads.append(d) or read_meta(d)))
+
+    def build():
+        from models.book import db
+        with app.app_context():
+            return catalog_snapshot.build(db.session, str(directory), False, 7)
+    build.reads = reads
+    build.directory = directory
+    return build
+
+
+def served():
+    return catalog_snapshot.stats()["served"]
+
+
+def test_hits_do_not_reread_meta(client, snapshot):
+    client.post("/books", json=[{"title": "t%d" % i, "author": "a"} for i in range(10)])
+    assert snapshot() is True
+    assert snapshot() is False
+
+    before, reads = served(), len(snapshot.reads)
+    for _ in range(3):
+        assert len(client.get("/books?stream=1").json) == 10
+    assert served() == before + 3
+    assert len(snapshot.reads) == reads + 1
+
+
+def test_write_makes_snapshot_stale(client, snapshot):
+    client.post("/books", json={"title": "a", "author": "x"})
+    snapshot()
+    client.get("/books?stream=1")
+    client.patch("/books/1", json={"title": "b"})
+
+    before = served()
+    assert client.get("/books?stream=1").json[0]["title"] == "b"
+    assert served() == before
+    snapshot()
+    assert client.get("/books?stream=1").json[0]["title"] == "b"
+    assert served() == before + 1
+
+
+def test_recreated_table_does_not_match_old_snapshot(app, client, snapshot):
+    from models.book import db
+    client.post("/books", json={"title": "a", "author": "x"})
+    snapshot()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    # the same writes again: a counter that restarted would match
+    client.post("/books", json={"title": "b", "author": "x"})
+    before = served()
+    assert client.get("/books?stream=1").json[0]["title"] == "b"
+    assert served() == before
+
+
+def test_default_directory_is_under_instance_path(app):
+    from config import Config
+    from utils.files import instance_path
+    assert not os.path.isabs(Config.BOOKS_SNAPSHOT_DIR)
+    assert instance_path(app, Config.BOOKS_SNAPSHOT_DIR).startswith(app.instance_path + os.sep)
+
+
+def test_build_creates_private_directory(snapshot):
+    snapshot()
+    assert stat.S_IMODE(os.stat(snapshot.directory).st_mode) == 0o700
+
+
+def test_build_refuses_directory_others_can_write(snapshot):
+    snapshot.directory.mkdir(mode=0o777)
+    os.chmod(snapshot.directory, 0o777)
+    with pytest.raises(PermissionError):
+        snapshot()
+
+
+def test_build_does_not_follow_lock_symlink(snapshot, tmp_path):
+    target = tmp_path / "precious"
+    target.write_text("keep")
+    snapshot.directory.mkdir(mode=0o700)
+    os.symlink(target, snapshot.directory / "catalog.lock")
+    with pytest.raises(OSError):
+        snapshot()
+    assert target.read_text() == "keep"
+
+
+def test_untrusted_directory_is_not_served(client, snapshot):
+    client.post("/books", json={"title": "a", "author": "x"})
+    snapshot()
+    os.chmod(snapshot.directory, 0o777)
+    before = served()
+    assert client.get("/books?stream=1").json[0]["title"] == "a"
+    assert served() == before
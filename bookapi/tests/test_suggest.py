@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+import resources.book_resources
+from utils import changes
+from utils.suggest import SuggestIndex
+
+
+@pytest.fixture
+def index(app, monkeypatch):
+    index = SuggestIndex()
+    monkeypatch.setattr(resources.book_resources, "suggest_index", index)
+    monkeypatch.setattr(changes, "_listeners", changes._listeners + [index.apply])
+    return index
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def texts(response):
+    return [item["text"] for item in response.json]
+
+
+def test_first_request_is_not_answered_from_the_database(client, index):
+    client.post("/books", json={"title": "Dune", "author": "Herbert"})
+    response = client.get("/books/suggest?prefix=du")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    wait_for(lambda: index.ready)
+    assert texts(client.get("/books/suggest?prefix=du")) == ["Dune"]
+
+
+def test_writes_are_applied_in_place(app, client, index):
+    client.post("/books", json={"title": "Dune", "author": "Herbert"})
+    from models.book import db
+    with app.app_context():
+        assert index.build(db.session) is True
+        assert index.build(db.session) is False
+
+    client.put("/books/1", json={"title": "Emma"})
+    assert texts(client.get("/books/suggest?prefix=du")) == []
+    assert texts(client.get("/books/suggest?prefix=em")) == ["Emma"]
+    assert index.builds == 1
+
+
+def test_import_keeps_old_index_until_rebuilt(app, client, index):
+    from models.book import db
+    client.post("/books", json={"title": "Dune", "author": "Herbert"})
+    with app.app_context():
+        index.build(db.session)
+    index.schedule(app)
+    wait_for(lambda: index.stats()["builds"] >= 1 and not index._wake.is_set())
+
+    client.post("/books/import", data=b"title,author\nEmma,Austen\n", content_type="text/csv")
+    # answered straight away from the old index, rebuilt in the background
+    assert texts(client.get("/books/suggest?prefix=du")) == ["Dune"]
+    wait_for(lambda: texts(client.get("/books/suggest?prefix=em")) == ["Emma"])
+    assert not index.stats()["stale"]
+
+
+def test_rebuild_picks_up_writes_it_did_not_see(app, client, index):
+    from models.book import db
+    client.post("/books", json={"title": "Dune", "author": "Herbert"})
+    with app.app_context():
+        index.build(db.session)
+        # another worker's write: committed, but this index's hook never ran
+        db.session.execute(db.text("INSERT INTO new_book (title, author) VALUES ('Emma', 'Austen')"))
+        db.session.commit()
+        assert index.build(db.session) is True
+    assert texts(client.get("/books/suggest?prefix=em")) == ["Emma"]
+
+
+def test_changes_during_a_build_are_replayed(app, client, index, monkeypatch):
+    from models.book import db
+    client.post("/books", json={"title": "Dune", "author": "Herbert"})
+    scanning, resume = threading.Event(), threading.Event()
+    book_entries = SuggestIndex._book_entries
+
+    def slow_entries(title, author):
+        scanning.set()
+        resume.wait(5)
+        return book_entries(title, author)
+
+    monkeypatch.setattr(index, "_book_entries", slow_entries)
+
+    def build():
+        with app.app_context():
+            index.build(db.session)
+
+    thread = threading.Thread(target=build)
+    thread.start()
+    scanning.wait(5)
+    monkeypatch.setattr(index, "_book_entries", book_entries)
+    index.apply({2: {"id": 2, "title": "Emma", "author": "Austen"}}, {1}, False)
+    resume.set()
+    thread.join(5)
+
+    assert index.suggest("du") == []
+    assert [item["text"] for item in index.suggest("em")] == ["Emma"]
+
+
+def test_preload_starts_on_first_request_not_import(monkeypatch):
+    from flask import Flask
+    index = SuggestIndex()
+    monkeypatch.setattr(index, "schedule", lambda app: setattr(index, "_thread", app))
+    app = Flask(__name__)
+    app.config["BOOKS_SUGGEST_PRELOAD"] = True
+    index.init_app(app)
+    app.add_url_rule("/", "home", lambda: "")
+    assert index._thread is None
+    app.test_client().get("/")
+    assert index._thread is app
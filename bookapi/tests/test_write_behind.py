@@ -0,0 +1,30 @@
+import time
+
+from resources import book_resources
+from utils.write_behind import WriteBehindQueue
+
+
+def wait_for_job(queue, app, job_id):
+    deadline = time.monotonic() + 5
+    while True:
+        job = queue.job(app, job_id)
+        if job["status"] != "queued" or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+def test_job_state_is_visible_to_other_workers(app, client, monkeypatch, tmp_path):
+    app.config.update(BOOKS_ASYNC_WRITES=True, BOOKS_ASYNC_FLUSH_MS=0,
+                      BOOKS_ASYNC_JOB_URL="sqlite:///%s" % (tmp_path / "jobs.db"))
+    monkeypatch.setattr(book_resources, "write_behind", WriteBehindQueue())
+    response = client.post("/books?async=1", json={"title": "Dune", "author": "Herbert"})
+    assert response.status_code == 202
+
+    # a second queue on the same store stands in for another worker
+    job = wait_for_job(WriteBehindQueue(), app, response.json["job"])
+    assert job == {"status": "done", "book": {"id": 1, "title": "Dune", "author": "Herbert"}}
+    assert client.get(response.json["status_url"]).json == dict(job, job=response.json["job"])
+
+
+def test_unknown_job(app, client):
+    assert client.get("/books/jobs/nope").status_code == 404
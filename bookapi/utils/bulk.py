@@ -0,0 +1,121 @@
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.book import Book
+from utils.changes import record_change
+
+
+def insert_books(session, rows, batch_size):
+    # One executemany; SQLAlchemy's insertmanyvalues turns it into
+    # multi-row INSERT ... VALUES (...), (...) RETURNING id statements of
+    # batch_size rows each, with ids matched back to input order. The caller
+    # owns the transaction.
+    if not rows:
+        return []
+    statement = insert(Book).returning(Book.id, sort_by_parameter_order=True)
+    result = session.execute(statement, rows, execution_options={"insertmanyvalues_page_size": batch_size})
+    ids = list(result.scalars())
+    record_change(session, upserted=[dict(row, id=book_id) for row, book_id in zip(rows, ids)])
+    return ids
+
+
+def upsert_books(session, rows, on_conflict, batch_size):
+    # INSERT ... ON CONFLICT (title, author): "update" returns the existing
+    # row for duplicates, "ignore" (DO NOTHING) returns only new rows. Input
+    # duplicates are dropped first; Postgres refuses to touch one row twice
+    # in a single statement.
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    unique = {}
+    for row in rows:
+        unique.setdefault((row["title"], row["author"]), row)
+    rows = list(unique.values())
+
+    returned = []
+    for start in range(0, len(rows), batch_size):
+        statement = dialect.insert(Book).values(rows[start:start + batch_size])
+        if on_conflict == "ignore":
+            statement = statement.on_conflict_do_nothing(index_elements=["title", "author"])
+        else:
+            statement = statement.on_conflict_do_update(index_elements=["title", "author"],
+                                                        set_={"title": statement.excluded.title})
+        result = session.execute(statement.returning(Book.id, Book.title, Book.author))
+        returned.extend(row._asdict() for row in result)
+    record_change(session, upserted=returned)
+    return returned
+
+
+def insert_new_books(session, rows, batch_size):
+    # insert_books under a unique natural key: rows whose (title, author)
+    # already exists, in the table or earlier in rows, are skipped and get
+    # None in place of an id.
+    created = {(row["title"], row["author"]): row["id"] for row in upsert_books(session, rows, "ignore", batch_size)}
+    return [created.pop((row["title"], row["author"]), None) for row in rows]
+
+
+def _chunked(ids, clauses, batch_size, execute):
+    # Runs execute(selection) once per chunk; it must commit and return the
+    # affected ids, or roll back and return [] when nothing matched. Explicit id lists are cut into batch_size slices. Filters
+    # are walked in id order with "id IN (SELECT id ... WHERE id > :last
+    # ORDER BY id LIMIT n)", so each chunk starts where the previous ended.
+    total = 0
+    if ids is not None:
+        for start in range(0, len(ids), batch_size):
+            total += len(execute(Book.id.in_(ids[start:start + batch_size])))
+        return total
+
+    last = 0
+    while True:
+        subquery = select(Book.id).where(*clauses, Book.id > last).order_by(Book.id).limit(batch_size)
+        affected = execute(Book.id.in_(subquery.scalar_subquery()))
+        if not affected:
+            return total
+        total += len(affected)
+        last = max(affected)
+
+
+def _nothing(session):
+    # no commit for a chunk that matched nothing (the last one of every
+    # filter walk): it would bump the catalog version on Postgres, whose
+    # trigger fires once per statement, and invalidate every cached page
+    session.rollback()
+    return []
+
+
+def _changed(values):
+    # rows already holding the new values are left alone
+    return or_(*(getattr(Book, key) != value for key, value in values.items()))
+
+
+def count_matching(session, ids, clauses, values=None):
+    where = [Book.id.in_(ids)] if ids is not None else list(clauses)
+    if values:
+        where.append(_changed(values))
+    return session.execute(select(func.count()).select_from(Book).where(*where)).scalar_one()
+
+
+def bulk_update(session, ids, clauses, values, batch_size):
+    changed = _changed(values)
+
+    def execute(selection):
+        statement = (update(Book).where(selection, changed).values(version=Book.version + 1, **values)
+                     .returning(Book.id, Book.title, Book.author))
+        rows = session.execute(statement).all()
+        if not rows:
+            return _nothing(session)
+        record_change(session, upserted=[row._asdict() for row in rows])
+        session.commit()
+        return [row.id for row in rows]
+
+    return _chunked(ids, list(clauses) + [changed], batch_size, execute)
+
+
+def bulk_delete(session, ids, clauses, batch_size):
+    def execute(selection):
+        deleted = session.execute(delete(Book).where(selection).returning(Book.id)).scalars().all()
+        if not deleted:
+            return _nothing(session)
+        record_change(session, deleted=deleted)
+        session.commit()
+        return deleted
+
+    return _chunked(ids, clauses, batch_size, execute)
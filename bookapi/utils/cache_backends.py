@@ -0,0 +1,219 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# Byte-string caches behind the response cache. Every backend offers the
+# same small interface:
+#   get(key) -> bytes | None      set(key, value, ttl)      delete(key)
+#   tag_version(tag) -> int       bump_tag(tag)
+# The caller stores the tag version alongside each entry, so invalidating a
+# tag is a single counter increment and outdated entries simply age out.
+
+
+class MemoryBackend:
+    # Per-process LRU. Invalidations made in one worker are not seen by
+    # others; use the sqlite or redis backend to share across workers.
+
+    def __init__(self, max_entries):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def tag_version(self, tag):
+        with self._lock:
+            return self._tags.get(tag, 0)
+
+    def bump_tag(self, tag):
+        with self._lock:
+            self._tags[tag] = self._tags.get(tag, 0) + 1
+
+
+class SQLiteBackend:
+    # A cache file shared by every worker on the host. WAL mode lets readers
+    # proceed while one worker writes. Size is enforced every PRUNE_EVERY
+    # writes by dropping expired rows and then the oldest ones.
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, max_entries):
+        self._path = path
+        self._max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_entries "
+                               "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_expires ON cache_entries (expires)")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connect().execute("SELECT value FROM cache_entries WHERE key = ? AND expires > ?",
+                                      (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)",
+                               (key, value, time.time() + ttl))
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                connection.execute("DELETE FROM cache_entries WHERE expires <= ?", (time.time(),))
+                connection.execute("DELETE FROM cache_entries WHERE key IN (SELECT key FROM cache_entries "
+                                   "ORDER BY expires DESC LIMIT -1 OFFSET ?)", (self._max_entries,))
+
+    def delete(self, key):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def tag_version(self, tag):
+        row = self._connect().execute("SELECT version FROM cache_tags WHERE tag = ?", (tag,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_tag(self, tag):
+        with self._connect() as connection:
+            connection.execute("INSERT INTO cache_tags (tag, version) VALUES (?, 1) "
+                               "ON CONFLICT (tag) DO UPDATE SET version = version + 1", (tag,))
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend:
+    # Minimal RESP2 client (GET/SET PX/DEL/INCR), enough to talk to Redis or
+    # any server speaking its protocol. Entry count is bounded by the
+    # server's maxmemory policy; ttl bounds every entry.
+
+    def __init__(self, host, port, db=0, prefix="bookapi:", timeout=1.0):
+        self._address = (host, port)
+        self._db = db
+        self._prefix = prefix
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._socket = None
+        self._reader = None
+
+    def _connect(self):
+        self._socket = socket.create_connection(self._address, timeout=self._timeout)
+        self._reader = self._socket.makefile("rb")
+        if self._db:
+            self._send("SELECT", self._db)
+
+    def _close(self):
+        if self._socket is not None:
+            self._socket.close()
+        self._socket = self._reader = None
+
+    def _send(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self._socket.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise RedisError("unexpected reply %r" % line)
+
+    def _command(self, *args):
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._socket is None:
+                        self._connect()
+                    return self._send(*args)
+                except (OSError, ConnectionError):
+                    # reconnect once, e.g. after the server closed an idle connection
+                    self._close()
+                    if attempt == 2:
+                        raise
+
+    def get(self, key):
+        return self._command("GET", self._prefix + key)
+
+    def set(self, key, value, ttl):
+        self._command("SET", self._prefix + key, value, "PX", max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self._command("DEL", self._prefix + key)
+
+    def tag_version(self, tag):
+        value = self._command("GET", self._prefix + "tag:" + tag)
+        return int(value) if value is not None else 0
+
+    def bump_tag(self, tag):
+        self._command("INCR", self._prefix + "tag:" + tag)
+
+
+def create_backend(url, max_entries):
+    # memory://  |  sqlite:///relative.db, sqlite:////absolute.db (as in
+    # SQLAlchemy URLs)  |  redis://host:6379/0
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryBackend(max_entries)
+    if parsed.scheme == "sqlite":
+        path = parsed.path[1:]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SQLiteBackend(path, max_entries)
+    if parsed.scheme == "redis":
+        db = int(parsed.path.strip("/") or 0)
+        return RedisBackend(parsed.hostname or "localhost", parsed.port or 6379, db)
+    raise ValueError("unsupported cache URL %r" % url)
@@ -0,0 +1,62 @@
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models.book import Book
+
+log = logging.getLogger(__name__)
+
+# Callbacks run after a transaction that touched new_book commits. Each one
+# receives (upserted, deleted, reload): rows as {"id", "title", "author"}
+# dicts keyed by id, a set of deleted ids, and a flag that says the change
+# was too large to describe row by row (bulk loads) and caches should reload.
+_listeners = []
+
+
+def on_books_changed(fn):
+    _listeners.append(fn)
+    return fn
+
+
+def record_change(session, upserted=(), deleted=(), reload=False):
+    # Core statements bypass the ORM unit of work, so write paths that use
+    # them call this directly; ORM flushes are picked up below. A statement
+    # that matched nothing records nothing, so listeners never run for it.
+    if not (upserted or deleted or reload):
+        return
+    changes = session.info.setdefault("book_changes", {"upserted": {}, "deleted": set(), "reload": False})
+    for row in upserted:
+        changes["upserted"][row["id"]] = row
+        changes["deleted"].discard(row["id"])
+    for book_id in deleted:
+        changes["upserted"].pop(book_id, None)
+        changes["deleted"].add(book_id)
+    changes["reload"] = changes["reload"] or reload
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_orm_changes(session, flush_context):
+    upserted = [book.to_dict() for book in list(session.new) + list(session.dirty) if isinstance(book, Book)]
+    deleted = [book.id for book in session.deleted if isinstance(book, Book)]
+    if upserted or deleted:
+        record_change(session, upserted, deleted)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_changes(session):
+    changes = session.info.pop("book_changes", None)
+    if not changes:
+        return
+    for fn in _listeners:
+        try:
+            fn(changes["upserted"], changes["deleted"], changes["reload"])
+        except Exception:
+            # the data is already committed; a stale cache must not turn
+            # the write into a 500
+            log.exception("book change listener %r failed", fn)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("book_changes", None)
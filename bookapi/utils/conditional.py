@@ -0,0 +1,59 @@
+import hashlib
+
+from flask import Response, request
+from sqlalchemy import func, select
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+
+from models.book import CatalogVersion
+
+
+def version_etag(version):
+    return '"%d"' % version
+
+
+def if_match_versions():
+    # Versions listed in If-Match: None when the header is absent, "*" for
+    # "any current version". Weak tags never match (RFC 9110 13.1.1), so
+    # they are dropped and an If-Match of only weak tags matches nothing.
+    if_match = request.if_match
+    if not if_match:
+        return None
+    if if_match.star_tag:
+        return "*"
+    return {int(tag) for tag in if_match.as_set() if tag.isdigit()}
+
+
+def version_matches(versions, version):
+    return versions is None or versions == "*" or version in versions
+
+
+def weak_etag(*parts):
+    # Weak validator over whatever identifies the representation: the
+    # request (path, query, format) plus row ids/versions or table stamps.
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return quote_etag(digest, weak=True)
+
+
+def catalog_stamp(session):
+    # (version, changed_at) of the whole catalog: the counter stripes the
+    # new_book triggers bump, so it costs the same at any table size.
+    # Filtered listings use it too and just revalidate on any write, not
+    # only ones that touch their rows.
+    version, changed_at = session.execute(select(func.sum(CatalogVersion.version),
+                                                 func.max(CatalogVersion.changed_at))).one()
+    return int(version), changed_at
+
+
+def validators(etag, last_modified=None):
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag, last_modified=None):
+    # 304 with no body when If-None-Match / If-Modified-Since still match,
+    # else None. Called before any serialization happens.
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return Response(status=304, headers=validators(etag, last_modified))
@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import queue
+import threading
+import zlib
+
+from flask import Response, stream_with_context
+from sqlalchemy import select
+
+from utils.rows import BOOK_TABLE, book_columns
+
+_COPY_SQL = {
+    "csv": "COPY (SELECT id, title, author FROM new_book ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)",
+    # row_to_json output never contains control characters, so CSV mode with
+    # \x01/\x02 as quote/delimiter emits each JSON document verbatim (text
+    # mode would double every backslash).
+    "ndjson": "COPY (SELECT row_to_json(b) FROM (SELECT id, title, author FROM new_book ORDER BY id) AS b) "
+              "TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')",
+}
+
+MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+_DONE = object()
+
+
+class ChunkWriter:
+    # write() target for COPY TO: re-slices whatever psycopg2 hands us into
+    # fixed-size (optionally gzip-compressed) chunks passed to emit().
+
+    def __init__(self, emit, chunk_size, compress):
+        self._emit = emit
+        self._chunk_size = chunk_size
+        self._compressor = zlib.compressobj(wbits=31) if compress else None
+        self._buffer = bytearray()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self._compressor:
+            data = self._compressor.compress(data)
+        self._buffer += data
+        while len(self._buffer) >= self._chunk_size:
+            self._emit(bytes(self._buffer[:self._chunk_size]))
+            del self._buffer[:self._chunk_size]
+
+    def close(self):
+        if self._compressor:
+            self._buffer += self._compressor.flush()
+        if self._buffer:
+            self._emit(bytes(self._buffer))
+            self._buffer.clear()
+
+
+def _copy_chunks(engine, sql, chunk_size, compress):
+    # copy_expert blocks until the whole COPY is written, so it runs on its
+    # own connection in a thread and hands chunks over through a small
+    # bounded queue; a slow client stalls COPY instead of growing memory.
+    chunks = queue.Queue(maxsize=8)
+    cancelled = threading.Event()
+
+    def put(item):
+        while True:
+            if cancelled.is_set():
+                raise RuntimeError("export cancelled")
+            try:
+                chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def run():
+        connection = None
+        try:
+            # inside the try: a failed connect must reach the reader too
+            connection = engine.raw_connection()
+            writer = ChunkWriter(put, chunk_size, compress)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(sql, writer)
+            writer.close()
+            put(_DONE)
+        except Exception as err:
+            if not cancelled.is_set():
+                put(err)
+        finally:
+            if connection is not None:
+                connection.close()
+
+    thread = threading.Thread(target=run, name="books-export", daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                item = chunks.get(timeout=1)
+            except queue.Empty:
+                # a thread that died without queuing its result never will
+                if thread.is_alive() or not chunks.empty():
+                    continue
+                raise RuntimeError("export thread exited without finishing")
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # also reached when the client disconnects mid-download
+        cancelled.set()
+
+
+def _row_chunks(session, fmt, chunk_size, compress, batch_size):
+    # Fallback for databases without COPY: stream rows in batches and encode
+    # them with the same chunking.
+    ready = []
+    writer = ChunkWriter(ready.append, chunk_size, compress)
+    statement = select(*book_columns()).order_by(BOOK_TABLE.c.id)
+    result = session.execute(statement.execution_options(yield_per=batch_size))
+
+    if fmt == "csv":
+        text = io.StringIO()
+        encoder = csv.writer(text, lineterminator="\n")
+        encoder.writerow(("id", "title", "author"))
+    for batch in result.partitions():
+        if fmt == "csv":
+            encoder.writerows(batch)
+            writer.write(text.getvalue())
+            text.seek(0)
+            text.truncate()
+        else:
+            writer.write("".join(json.dumps(row._asdict()) + "\n" for row in batch))
+        yield from ready
+        ready.clear()
+    if fmt == "csv" and text.getvalue():
+        writer.write(text.getvalue())
+    writer.close()
+    yield from ready
+
+
+def export_response(session, engine, fmt, compress, chunk_size, batch_size):
+    if engine.dialect.name == "postgresql":
+        chunks = _copy_chunks(engine, _COPY_SQL[fmt], chunk_size, compress)
+    else:
+        chunks = _row_chunks(session, fmt, chunk_size, compress, batch_size)
+
+    headers = {"Content-Disposition": "attachment; filename=books.%s" % fmt}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(chunks), mimetype=MIMETYPES[fmt], headers=headers)
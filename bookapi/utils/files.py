@@ -0,0 +1,31 @@
+import os
+import stat
+
+# On-disk caches hold files other workers trust (snapshot bodies, the shared
+# item cache), so they live in a directory only the app's user can write to,
+# and are opened without following symlinks.
+
+
+def instance_path(app, path):
+    # relative config paths are under the app's instance folder, so separate
+    # deployments on one host never share (and clean up) each other's files
+    return os.path.join(app.instance_path, path)
+
+
+def private_directory(path, create=True):
+    if create:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid() or info.st_mode & 0o022:
+        raise PermissionError("%s must be a directory owned by this user and not writable by others" % path)
+    return path
+
+
+def open_private(path, flags=os.O_RDWR | os.O_CREAT):
+    # os.open that refuses a symlink at path or a file another user owns
+    fd = os.open(path, flags | os.O_NOFOLLOW | os.O_CLOEXEC, 0o600)
+    info = os.fstat(fd)
+    if not stat.S_ISREG(info.st_mode) or info.st_uid != os.geteuid():
+        os.close(fd)
+        raise PermissionError("%s must be a regular file owned by this user" % path)
+    return fd
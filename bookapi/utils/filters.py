@@ -0,0 +1,13 @@
+from sqlalchemy import func
+
+
+def book_filters(model, args):
+    # Translate the list filters in the query string into WHERE clauses.
+    clauses = []
+    author = args.get("author")
+    if author:
+        clauses.append(model.author == author)
+    title_prefix = args.get("title_prefix")
+    if title_prefix:
+        clauses.append(func.lower(model.title).startswith(title_prefix.lower(), autoescape=True))
+    return clauses
@@ -0,0 +1,13 @@
+import json
+
+from flask import Response
+
+
+def encode_json(data):
+    # same body flask-restful would send, encoded once so it can be cached
+    return (json.dumps(data) + "\n").encode()
+
+
+def json_response(body, status=200, headers=None):
+    # flask-restful passes Response objects through untouched
+    return Response(body, status=status, mimetype="application/json", headers=headers)
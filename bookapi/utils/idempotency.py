@@ -0,0 +1,99 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+from flask_restful.utils import unpack
+
+
+class IdempotencyStore:
+    # Responses to requests carrying an Idempotency-Key, kept for ttl
+    # seconds and at most max_entries (oldest evicted first). A request whose
+    # key is still being processed waits for that request to finish and then
+    # replays its response instead of running the write a second time. If
+    # that request stored nothing (it raised or failed with a 5xx), one of
+    # the waiters runs the write itself.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()
+        self._in_flight = {}
+        self.replays = 0
+        self.evictions = 0
+
+    def run(self, key, fingerprint, fn, ttl, max_entries, wait_timeout):
+        while True:
+            with self._lock:
+                self._expire()
+                replay = self._replay(key, fingerprint)
+                if replay is not None:
+                    return replay
+                event = self._in_flight.get(key)
+                owner = event is None
+                if owner:
+                    event = self._in_flight[key] = threading.Event()
+            if owner:
+                break
+            if not event.wait(wait_timeout):
+                return {"error": "A request with this Idempotency-Key is still in progress"}, 409
+
+        response = None
+        try:
+            response = unpack(fn())
+            return response
+        finally:
+            with self._lock:
+                # server errors are not stored, so the client may retry them
+                if response is not None and response[1] < 500:
+                    self._responses[key] = (time.monotonic() + ttl, fingerprint, response)
+                    while len(self._responses) > max_entries:
+                        self._responses.popitem(last=False)
+                        self.evictions += 1
+                del self._in_flight[key]
+            event.set()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._responses), "in_flight": len(self._in_flight),
+                    "replays": self.replays, "evictions": self.evictions}
+
+    def _replay(self, key, fingerprint):
+        entry = self._responses.get(key)
+        if entry is None:
+            return None
+        if entry[1] != fingerprint:
+            return {"error": "Idempotency-Key was already used with a different request"}, 422
+        self.replays += 1
+        data, status, headers = entry[2]
+        return data, status, dict(headers, **{"Idempotent-Replayed": "true"})
+
+    def _expire(self):
+        # entries are stored in creation order and share one ttl
+        now = time.monotonic()
+        while self._responses:
+            key, entry = next(iter(self._responses.items()))
+            if entry[0] > now:
+                break
+            del self._responses[key]
+
+
+idempotency_store = IdempotencyStore()
+
+
+def idempotent(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return fn(*args, **kwargs)
+        config = current_app.config
+        # the key is per method and path; the query string (?on_conflict=,
+        # ?async=) is part of the request the key was first used with
+        fingerprint = hashlib.sha256(request.query_string + b"\n" + request.get_data()).hexdigest()
+        return idempotency_store.run((request.method, request.path, key), fingerprint,
+                                     lambda: fn(*args, **kwargs),
+                                     config["BOOKS_IDEMPOTENCY_TTL"], config["BOOKS_IDEMPOTENCY_MAX_ENTRIES"],
+                                     config["BOOKS_IDEMPOTENCY_WAIT_TIMEOUT"])
+    return wrapper
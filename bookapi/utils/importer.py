@@ -0,0 +1,212 @@
+import csv
+import gzip
+import io
+import json
+import time
+
+from marshmallow import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.dialects import sqlite
+
+from models.book import UNIQUE_NATURAL_KEY, Book
+from utils.changes import record_change
+
+COPY_SQL = "COPY new_book (title, author) FROM STDIN WITH (FORMAT csv)"
+# Under a unique natural key COPY goes to a staging table first, since COPY
+# itself cannot skip conflicting rows.
+STAGE_SQL = "CREATE TEMP TABLE new_book_import (title text, author text) ON COMMIT DROP"
+STAGED_COPY_SQL = "COPY new_book_import (title, author) FROM STDIN WITH (FORMAT csv)"
+MERGE_STAGED_SQL = ("INSERT INTO new_book (title, author) SELECT title, author FROM new_book_import "
+                    "ON CONFLICT (title, author) DO NOTHING")
+MAX_REPORTED_ERRORS = 100
+# what a bad upload raises while it is read: truncated or invalid gzip, bad
+# UTF-8, malformed CSV
+READ_ERRORS = (OSError, UnicodeDecodeError, csv.Error)
+
+
+def detect_format(name):
+    # "books.csv.gz" -> ("csv", True)
+    name = (name or "").lower()
+    compressed = name.endswith(".gz")
+    if compressed:
+        name = name[:-3]
+    if name.endswith(".csv"):
+        return "csv", compressed
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson", compressed
+    return None, compressed
+
+
+def open_text(stream, compressed):
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+
+def read_records(text, fmt):
+    # Yields (line number, record); a record of None means unparseable.
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_num, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_num, record
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def reject(self, line_num, messages):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_num, "errors": messages})
+
+    def skip_duplicates(self, count):
+        # natural key clashes found by the database after validation: they
+        # count as rejected, but have no line numbers
+        self.imported -= count
+        self.rejected += count
+        self.duplicates += count
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def to_dict(self):
+        rate = self.imported / self.seconds if self.seconds else 0.0
+        return {"imported": self.imported, "rejected": self.rejected, "duplicates": self.duplicates,
+                "errors": self.errors,
+                "seconds": round(self.seconds, 3), "rows_per_second": round(rate, 1)}
+
+
+def validated_rows(records, schema, report, block_size):
+    # Records are loaded block_size at a time with many=True: per-call
+    # overhead in BookSchema.load dwarfs per-row validation cost.
+    block = []
+    for line_num, record in records:
+        if not isinstance(record, dict):
+            report.reject(line_num, {"_schema": ["Invalid record."]})
+            continue
+        # only the columns COPY writes; an exported id column is ignored
+        block.append((line_num, {key: record[key] for key in ("title", "author") if key in record}))
+        if len(block) >= block_size:
+            yield from _load_block(block, schema, report)
+            block = []
+    if block:
+        yield from _load_block(block, schema, report)
+
+
+def _load_block(block, schema, report):
+    try:
+        rows = schema.load([record for _, record in block], many=True)
+        errors = {}
+    except ValidationError as err:
+        rows, errors = err.valid_data, err.messages
+    for i, ((line_num, _), row) in enumerate(zip(block, rows)):
+        if i in errors:
+            report.reject(line_num, errors[i])
+            continue
+        report.imported += 1
+        yield row
+
+
+class CopySource:
+    # File-like object for copy_expert: encodes validated rows as CSV on
+    # demand, so at most one block of rows is held in memory at a time.
+    # psycopg2 turns an exception raised by read() into a cancelled COPY, so
+    # the original is kept in error for copy_rows to re-raise.
+
+    def __init__(self, rows, block_size=1000):
+        self._rows = iter(rows)
+        self._block_size = block_size
+        self._buffer = ""
+        self.error = None
+
+    def _encode_block(self):
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        for _, row in zip(range(self._block_size), self._rows):
+            writer.writerow((row["title"], row["author"]))
+        return out.getvalue()
+
+    def read(self, size=-1):
+        try:
+            return self._read(size)
+        except Exception as err:
+            self.error = err
+            raise
+
+    def _read(self, size):
+        while size < 0 or len(self._buffer) < size:
+            block = self._encode_block()
+            if not block:
+                break
+            self._buffer += block
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def copy_rows(cursor, sql, source):
+    try:
+        cursor.copy_expert(sql, source)
+    except Exception:
+        if source.error is not None:
+            raise source.error
+        raise
+
+
+def import_books(session, text, fmt, schema, batch_size):
+    # Streams records through validation into new_book and commits once.
+    # Postgres gets a single COPY FROM STDIN; other databases get batched
+    # executemany INSERTs. Under a unique natural key, rows that already
+    # exist are skipped and reported as duplicates.
+    report = ImportReport()
+    rows = validated_rows(read_records(text, fmt), schema, report, batch_size)
+
+    if session.get_bind().dialect.name == "postgresql":
+        dbapi_connection = session.connection().connection
+        with dbapi_connection.cursor() as cursor:
+            if UNIQUE_NATURAL_KEY:
+                cursor.execute(STAGE_SQL)
+                copy_rows(cursor, STAGED_COPY_SQL, CopySource(rows, batch_size))
+                cursor.execute(MERGE_STAGED_SQL)
+                report.skip_duplicates(report.imported - cursor.rowcount)
+            else:
+                copy_rows(cursor, COPY_SQL, CopySource(rows, batch_size))
+    else:
+        # the table, not the entity: a Core insert reports its rowcount
+        statement = insert(Book.__table__)
+        if UNIQUE_NATURAL_KEY:
+            statement = sqlite.insert(Book.__table__).on_conflict_do_nothing(index_elements=["title", "author"])
+        inserted = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                inserted += session.execute(statement, batch).rowcount
+                batch = []
+        if batch:
+            inserted += session.execute(statement, batch).rowcount
+        if UNIQUE_NATURAL_KEY:
+            report.skip_duplicates(report.imported - inserted)
+
+    # too many rows to describe individually; caches reload instead
+    record_change(session, reload=True)
+    session.commit()
+    report.finish()
+    return report
@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+
+from utils.changes import on_books_changed
+from utils.files import instance_path, private_directory
+from utils.shared_cache import get_shared_cache
+
+log = logging.getLogger(__name__)
+
+
+class ItemCache:
+    # LRU of pre-encoded GET /books/<id> responses: id -> (body bytes, ETag,
+    # Last-Modified). Entries are dropped by the post-commit change hook, so
+    # every write path (single, bulk, upsert, import) invalidates them.
+    #
+    # epoch guards the read-then-fill race: a reader takes the epoch before
+    # querying and put() refuses the entry if any invalidation happened in
+    # between, so a row read just before a commit can never be cached after
+    # that commit's invalidation.
+    #
+    # The hook only runs in the worker that committed, so other workers keep
+    # their copy until it expires: entries live at most ttl seconds.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.expirations = 0
+
+    def get(self, book_id):
+        with self._lock:
+            item = self._entries.get(book_id)
+            if item is not None and item[0] is not None and item[0] <= time.monotonic():
+                del self._entries[book_id]
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(book_id)
+            self.hits += 1
+            return item[1]
+
+    def put(self, book_id, entry, epoch, max_entries, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if epoch != self.epoch:
+                return
+            self._entries[book_id] = (expires, entry)
+            self._entries.move_to_end(book_id)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def apply(self, upserted, deleted, reload):
+        with self._lock:
+            self.epoch += 1
+            if reload:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                return
+            for book_id in list(upserted) + list(deleted):
+                if self._entries.pop(book_id, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {"tier": "lru", "entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "invalidations": self.invalidations,
+                    "expirations": self.expirations}
+
+
+item_cache = ItemCache()
+on_books_changed(item_cache.apply)
+
+
+def get_item_cache():
+    config = current_app.config
+    if config["BOOKS_ITEM_CACHE"] != "shared":
+        return item_cache
+    path = instance_path(current_app, config["BOOKS_SHARED_CACHE_PATH"])
+    try:
+        private_directory(os.path.dirname(path))
+        return get_shared_cache(path, config["BOOKS_SHARED_CACHE_SLOTS"], config["BOOKS_SHARED_CACHE_SLOT_SIZE"])
+    except (OSError, ValueError):
+        log.exception("shared item cache unavailable, using the per-process LRU")
+        config["BOOKS_ITEM_CACHE"] = "lru"
+        return item_cache
+
+
+@on_books_changed
+def _invalidate_shared(upserted, deleted, reload):
+    # Opens the file if this worker has not read through it yet: entries
+    # cached by other workers must still be dropped by its writes.
+    if has_app_context() and current_app.config["BOOKS_ITEM_CACHE"] == "shared":
+        cache = get_item_cache()
+        if cache is not item_cache:
+            cache.apply(upserted, deleted, reload)
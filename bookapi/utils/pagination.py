@@ -0,0 +1,99 @@
+import base64
+import binascii
+import json
+import math
+from urllib.parse import urlencode
+
+from sqlalchemy import tuple_
+
+# Columns a client may sort (and therefore page) by. `id` is always the
+# tie-breaker so every key is unique and the keyset is stable.
+SORT_KEYS = ("id", "title", "author")
+
+# What a cursor holds for each sort: the sort column's value, then the id
+# (search pages are sorted by rank). Anything else would reach the database
+# as a bind parameter of the wrong type and fail there.
+CURSOR_TYPES = {
+    "id": (int,),
+    "title": (str, int),
+    "author": (str, int),
+    "rank": (float, int),
+}
+
+
+def parse_sort(value):
+    value = value or "id"
+    descending = value.startswith("-")
+    key = value[1:] if descending else value
+    if key not in SORT_KEYS:
+        raise ValueError("sort must be one of: %s" % ", ".join(SORT_KEYS))
+    return key, descending
+
+
+def parse_limit(value, default, maximum):
+    if value in (None, ""):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
+
+
+def encode_cursor(sort, values):
+    raw = json.dumps([sort, values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token, sort):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        cursor_sort, values = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if cursor_sort != sort or not isinstance(values, list):
+        raise ValueError("cursor does not match sort order")
+    types = CURSOR_TYPES[sort]
+    if len(values) != len(types) or not all(_is_type(value, t) for value, t in zip(values, types)):
+        raise ValueError("invalid cursor")
+    return values
+
+
+def _is_type(value, expected):
+    # json gives bools for true/false and floats for NaN/Infinity
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, float):
+        return expected is float and math.isfinite(value)
+    return isinstance(value, expected) or (expected is float and isinstance(value, int))
+
+
+def keyset_page(session, statement, model, sort, descending, after, limit):
+    # WHERE (sort_col, id) > (:value, :id) ORDER BY sort_col, id LIMIT n+1
+    # walks the index from the cursor position, so page N costs the same as
+    # page 1. One extra row tells us whether there is a next page. model is
+    # anything with the sort columns as attributes (Book, BOOK_TABLE.c).
+    columns = [model.id] if sort == "id" else [getattr(model, sort), model.id]
+    if after is not None:
+        if len(after) != len(columns):
+            raise ValueError("invalid cursor")
+        key = tuple_(*columns)
+        statement = statement.where(key < tuple_(*after) if descending else key > tuple_(*after))
+    order = [c.desc() for c in columns] if descending else columns
+    rows = session.execute(statement.order_by(*order).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        values = [last.id] if sort == "id" else [getattr(last, sort), last.id]
+        next_cursor = encode_cursor(sort, values)
+    return rows, next_cursor
+
+
+def next_link(base_url, args, cursor):
+    params = args.to_dict(flat=False)
+    params["after"] = [cursor]
+    return '<%s?%s>; rel="next"' % (base_url, urlencode(params, doseq=True))
@@ -0,0 +1,237 @@
+import json
+import logging
+import threading
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, current_app, request
+from flask_restful.utils import unpack
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.http import parse_date
+
+from utils.cache_backends import create_backend
+from utils.changes import on_books_changed
+from utils.conditional import not_modified
+from utils.http import encode_json, json_response
+from utils.streaming import wants_stream
+
+log = logging.getLogger(__name__)
+
+BOOKS_TAG = "books"
+
+
+class ResponseCache:
+    # Pre-encoded GET responses keyed on the normalized request. Each stored
+    # value is a JSON header line ({"status", "headers", "stored_at",
+    # "version"}) followed by the body. version is the tag version the
+    # response was computed under; a write to new_book bumps the "books"
+    # tag, and older entries stop being served as fresh.
+    #
+    # An entry is fresh for ttl seconds. For stale_while_revalidate seconds
+    # after that it is still served while one background refresh per key
+    # recomputes it. Entries outdated by a write, or past that window, are
+    # only served (for up to stale_if_error seconds) when recomputing fails
+    # with a database error.
+
+    def __init__(self, backend, ttl, stale_while_revalidate, stale_if_error):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.stores = 0
+        self.refreshes = 0
+        self.errors = 0
+        self.served_on_error = 0
+
+    def key(self, tag):
+        # re-encoded, so an escaped "&" or "=" inside a value cannot make
+        # two different queries share a key
+        query = urlencode(sorted(request.args.items(multi=True)))
+        return "%s:%s?%s" % (tag, request.path, query)
+
+    def tag_version(self, tag):
+        return self.backend.tag_version(tag)
+
+    def lookup(self, key, version):
+        # -> (state, age, status, headers, body); state is "fresh", "stale"
+        # or "error" (usable only if recomputing fails)
+        value = self.backend.get(key)
+        entry = None
+        if value is not None:
+            meta, body = value.split(b"\n", 1)
+            meta = json.loads(meta)
+            age = max(0, int(time.time() - meta["stored_at"]))
+            if meta["version"] == version and age < self.ttl:
+                state = "fresh"
+            elif meta["version"] == version and age < self.ttl + self.stale_while_revalidate:
+                state = "stale"
+            elif age < self.ttl + self.stale_if_error:
+                state = "error"
+            else:
+                state = None
+            if state is not None:
+                entry = (state, age, meta["status"], meta["headers"], body)
+        with self._lock:
+            if entry is None or entry[0] == "error":
+                self.misses += 1
+            elif entry[0] == "fresh":
+                self.hits += 1
+            else:
+                self.stale += 1
+        return entry
+
+    def store(self, key, version, status, headers, body):
+        meta = json.dumps({"status": status, "headers": headers, "stored_at": time.time(), "version": version})
+        keep = self.ttl + max(self.stale_while_revalidate, self.stale_if_error)
+        self.backend.set(key, meta.encode() + b"\n" + body, keep)
+        with self._lock:
+            self.stores += 1
+
+    def refresh(self, key, tag, fn):
+        # Recomputes a stale entry in a background thread, under a copy of
+        # the current request without its conditional headers.
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        app = current_app._get_current_object()
+        context = {"path": request.path, "query_string": request.query_string.decode(),
+                   "headers": [("Accept", request.headers.get("Accept", "*/*"))]}
+        threading.Thread(target=self._refresh, args=(app, context, key, tag, fn), daemon=True).start()
+
+    def _refresh(self, app, context, key, tag, fn):
+        try:
+            with app.test_request_context(**context):
+                version = self.tag_version(tag)
+                rv = fn()
+                if not isinstance(rv, Response):
+                    data, status, headers = unpack(rv)
+                    if status == 200:
+                        self.store(key, version, status, dict(headers), encode_json(data))
+                        with self._lock:
+                            self.refreshes += 1
+        except Exception:
+            log.exception("response cache refresh failed")
+            self.record_error()
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record_served_on_error(self):
+        with self._lock:
+            self.served_on_error += 1
+
+    def invalidate(self, tag):
+        self.backend.bump_tag(tag)
+
+    def cache_control(self):
+        return "max-age=%d, stale-while-revalidate=%d, stale-if-error=%d" % (
+            self.ttl, self.stale_while_revalidate, self.stale_if_error)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "stale": self.stale, "misses": self.misses, "stores": self.stores,
+                    "refreshes": self.refreshes, "served_on_error": self.served_on_error, "errors": self.errors}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache():
+    url = current_app.config["BOOKS_CACHE_URL"]
+    if not url:
+        return None
+    with _caches_lock:
+        cache = _caches.get(url)
+        if cache is None:
+            backend = create_backend(url, current_app.config["BOOKS_CACHE_MAX_ENTRIES"])
+            cache = _caches[url] = ResponseCache(backend, current_app.config["BOOKS_CACHE_TTL"],
+                                                 current_app.config["BOOKS_CACHE_STALE_WHILE_REVALIDATE"],
+                                                 current_app.config["BOOKS_CACHE_STALE_IF_ERROR"])
+        return cache
+
+
+def cache_stats():
+    with _caches_lock:
+        return {url: cache.stats() for url, cache in _caches.items()}
+
+
+@on_books_changed
+def _invalidate_books(upserted, deleted, reload):
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.invalidate(BOOKS_TAG)
+
+
+def _cached(cache, entry, label):
+    _, age, status, headers, body = entry
+    last_modified = parse_date(headers.get("Last-Modified"))
+    cached = not_modified(headers["ETag"], last_modified) if "ETag" in headers else None
+    headers = dict(headers, **{"X-Cache": label, "Age": str(age), "Cache-Control": cache.cache_control()})
+    return cached or json_response(body, status, headers)
+
+
+def cached_response(tag=BOOKS_TAG):
+    # Wraps a flask-restful GET. Only plain 200 JSON results are stored;
+    # streamed and 304 responses pass through. A cache that cannot be
+    # reached is skipped rather than failing the request, and a request
+    # sent with Cache-Control: no-cache skips the stored copy.
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None or wants_stream(request):
+                return fn(*args, **kwargs)
+
+            try:
+                key = cache.key(tag)
+                version = cache.tag_version(tag)
+                entry = None if request.cache_control.no_cache else cache.lookup(key, version)
+            except Exception:
+                log.exception("response cache lookup failed")
+                cache.record_error()
+                return fn(*args, **kwargs)
+            if entry is not None and entry[0] == "fresh":
+                return _cached(cache, entry, "HIT")
+            if entry is not None and entry[0] == "stale":
+                cache.refresh(key, tag, lambda: fn(*args, **kwargs))
+                return _cached(cache, entry, "STALE")
+
+            try:
+                rv = fn(*args, **kwargs)
+            except SQLAlchemyError:
+                if entry is None:
+                    raise
+                log.exception("serving stale response after a database error")
+                cache.record_served_on_error()
+                return _cached(cache, entry, "STALE")
+            if isinstance(rv, Response):
+                return rv
+            data, status, headers = unpack(rv)
+            if status >= 500 and entry is not None:
+                cache.record_served_on_error()
+                return _cached(cache, entry, "STALE")
+            body = encode_json(data)
+            headers = dict(headers)
+            if status == 200:
+                try:
+                    cache.store(key, version, status, headers, body)
+                except Exception:
+                    log.exception("response cache store failed")
+                    cache.record_error()
+                headers["Cache-Control"] = cache.cache_control()
+            return json_response(body, status, dict(headers, **{"X-Cache": "MISS"}))
+        return wrapper
+    return decorator
@@ -0,0 +1,22 @@
+from models.book import Book
+from schemas.book import BOOK_FIELDS
+
+# Read paths select these plain table columns rather than Book (or its
+# instrumented attributes), so statements compile and execute as Core and
+# come back as Row tuples: no identity map, instance state or attribute
+# instrumentation per row. The compiled dumpers read Rows like instances.
+BOOK_TABLE = Book.__table__
+
+
+def book_columns(fields=None, extra=()):
+    # the requested fields (all by default) plus columns the caller needs
+    # for itself: sort keys, version and updated_at for the validators
+    names = list(fields or BOOK_FIELDS)
+    names += [name for name in extra if name not in names]
+    return [BOOK_TABLE.c[name] for name in names]
+
+
+def row_select(statement, fields=None, extra=()):
+    # Opt-in for custom queries: select(Book).where(...).order_by(...) with
+    # the entity swapped for table columns, keeping WHERE/ORDER BY/LIMIT.
+    return statement.with_only_columns(*book_columns(fields, extra), maintain_column_froms=True)
@@ -0,0 +1,113 @@
+import re
+import sqlite3
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from utils.pagination import encode_cursor
+
+# Every variant exposes (id, title, author, rank) with "higher rank is
+# better" so paging is identical: keyset on (rank DESC, id ASC).
+_POSTGRES_HITS = """
+    SELECT id, title, author, ts_rank(search_vector, query)::float8 AS rank
+    FROM new_book, websearch_to_tsquery('simple', :q) AS query
+    WHERE search_vector @@ query
+"""
+
+_SQLITE_HITS = """
+    SELECT b.id, b.title, b.author, -bm25(new_book_fts, 2.0, 1.0) AS rank
+    FROM new_book_fts JOIN new_book AS b ON b.id = new_book_fts.rowid
+    WHERE new_book_fts MATCH :q
+"""
+
+# Fuzzy matching: `%` filters on pg_trgm.similarity_threshold and `<->`
+# (1 - similarity) orders, both answered from the GiST trigram indexes, so
+# each probe is a KNN index scan that stops after the :candidates closest
+# titles or authors. The best :candidates books by rank are always among
+# the union of the two, so ranking is exact up to that bound.
+_POSTGRES_FUZZY_HITS = """
+    SELECT id, title, author,
+           greatest(similarity(title, :q), similarity(author, :q))::float8 AS rank
+    FROM (
+        (SELECT id, title, author FROM new_book
+         WHERE title % :q ORDER BY title <-> :q LIMIT :candidates)
+        UNION
+        (SELECT id, title, author FROM new_book
+         WHERE author % :q ORDER BY author <-> :q LIMIT :candidates)
+    ) AS candidates
+"""
+
+# SQLite has no trigram index; the Python similarity() registered below
+# scans the table, which is fine for local and test databases.
+_SQLITE_FUZZY_HITS = """
+    SELECT id, title, author, rank FROM (
+        SELECT id, title, author,
+               max(similarity(title, :q), similarity(author, :q)) AS rank
+        FROM new_book
+    )
+    WHERE rank >= :threshold
+    ORDER BY rank DESC, id
+    LIMIT :candidates
+"""
+
+
+def trigrams(value):
+    # Same trigram set pg_trgm builds: lower-cased alphanumeric words padded
+    # with two leading blanks and one trailing blank.
+    grams = set()
+    for word in re.findall(r"[^\W_]+", value.lower()):
+        word = "  " + word + " "
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def similarity(a, b):
+    if a is None or b is None:
+        return 0.0
+    left, right = trigrams(a), trigrams(b)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function("similarity", 2, similarity, deterministic=True)
+
+
+def _fts5_query(q):
+    # Quote every term so user input can never be parsed as FTS5 syntax.
+    return " ".join('"%s"' % term.replace('"', '""') for term in q.split())
+
+
+def search_books(session, q, limit, after=None, fuzzy=False, threshold=0.3, candidates=1000):
+    postgres = session.get_bind().dialect.name == "postgresql"
+    if fuzzy:
+        params = {"q": q, "threshold": threshold, "candidates": candidates}
+        if postgres:
+            session.execute(text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+                            {"threshold": str(threshold)})
+            hits = _POSTGRES_FUZZY_HITS
+        else:
+            hits = _SQLITE_FUZZY_HITS
+    elif postgres:
+        hits, params = _POSTGRES_HITS, {"q": q}
+    else:
+        hits, params = _SQLITE_HITS, {"q": _fts5_query(q)}
+
+    sql = "SELECT id, title, author, rank FROM (%s) AS hits" % hits
+    if after is not None:
+        if len(after) != 2:
+            raise ValueError("invalid cursor")
+        sql += " WHERE rank < :after_rank OR (rank = :after_rank AND id > :after_id)"
+        params.update(after_rank=after[0], after_id=after[1])
+    sql += " ORDER BY rank DESC, id LIMIT :limit"
+    params["limit"] = limit + 1
+
+    rows = session.execute(text(sql), params).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor("rank", [rows[-1].rank, rows[-1].id])
+    return rows, next_cursor
@@ -0,0 +1,213 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils.files import open_private
+
+MAGIC = b"BKIC"
+LAYOUT = 1
+WAYS = 4
+READ_ATTEMPTS = 3
+
+# magic, layout, slot count, slot size, epoch, generation
+HEADER = struct.Struct("<4sIIIQQ")
+HEADER_SIZE = 64
+EPOCH = struct.Struct("<Q")
+EPOCH_OFFSET = 16
+GENERATION_OFFSET = 24
+# seq, book id, generation, payload length, stamp
+SLOT = struct.Struct("<QqIIQ")
+SEQ = struct.Struct("<Q")
+# ETag length, Last-Modified length; followed by both and the body
+ENTRY = struct.Struct("<HH")
+
+
+class SharedItemCache:
+    # Same interface as ItemCache, but the entries live in an mmap'd file
+    # that every worker on the host maps, so the hot set is stored once and
+    # warmed once whatever the worker count.
+    #
+    # The file is a header plus a fixed array of slots, WAYS slots per set;
+    # a book id hashes to one set. Readers take no lock: each slot carries a
+    # seqlock counter that writers make odd while they rewrite the slot, and
+    # a reader that sees it odd, or changed by the time it has copied the
+    # payload, treats the read as a miss. Writers serialize on a byte-range
+    # lock, so a commit in any worker invalidates the slot for all of them.
+    #
+    # epoch is shared as well, keeping ItemCache's read-then-fill guard
+    # across processes. Bumping the generation drops every slot at once
+    # (bulk loads). The first process to open the file recreates it, so
+    # entries never outlive a full restart.
+
+    def __init__(self, path, slots, slot_size):
+        self.path = path
+        self.sets = max(1, slots // WAYS)
+        self.slots = self.sets * WAYS
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT.size
+        self._lock = threading.Lock()
+        # never through a symlink: the first opener truncates the file
+        self._fd = open_private(path)
+        self._map = None
+        self._open()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.oversize = 0
+
+    @contextmanager
+    def _mutex(self):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, 0)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, 0)
+
+    def _open(self):
+        size = HEADER_SIZE + self.slots * self.slot_size
+        with self._mutex():
+            # Byte 1 is held shared by every process using the file; getting
+            # it exclusively means nobody else has the file mapped.
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 1)
+                first = True
+            except OSError:
+                first = False
+            fcntl.lockf(self._fd, fcntl.LOCK_SH, 1, 1)
+
+            if first:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+            elif os.fstat(self._fd).st_size != size:
+                raise ValueError("%s is in use with a different slot layout" % self.path)
+            self._map = mmap.mmap(self._fd, size)
+            if first:
+                HEADER.pack_into(self._map, 0, MAGIC, LAYOUT, self.slots, self.slot_size, 0, 1)
+            elif HEADER.unpack_from(self._map, 0)[:4] != (MAGIC, LAYOUT, self.slots, self.slot_size):
+                raise ValueError("%s is in use with a different slot layout" % self.path)
+
+    @property
+    def epoch(self):
+        return EPOCH.unpack_from(self._map, EPOCH_OFFSET)[0]
+
+    def _generation(self):
+        return EPOCH.unpack_from(self._map, GENERATION_OFFSET)[0] & 0xFFFFFFFF
+
+    def _offsets(self, book_id):
+        index = ((book_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32
+        first = HEADER_SIZE + (index % self.sets) * WAYS * self.slot_size
+        return range(first, first + WAYS * self.slot_size, self.slot_size)
+
+    def _read(self, offset, book_id, generation):
+        for _ in range(READ_ATTEMPTS):
+            seq, slot_id, slot_generation, length, _ = SLOT.unpack_from(self._map, offset)
+            if seq & 1:
+                continue
+            if slot_id != book_id or slot_generation != generation or length > self.capacity:
+                return None
+            start = offset + SLOT.size
+            payload = self._map[start:start + length]
+            if SEQ.unpack_from(self._map, offset)[0] == seq:
+                return payload
+        return None
+
+    def get(self, book_id):
+        generation = self._generation()
+        for offset in self._offsets(book_id):
+            payload = self._read(offset, book_id, generation)
+            if payload is not None:
+                break
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        etag_length, modified_length = ENTRY.unpack_from(payload)
+        start = ENTRY.size + etag_length
+        last_modified = payload[start:start + modified_length].decode()
+        return (payload[start + modified_length:], payload[ENTRY.size:start].decode(),
+                datetime.fromisoformat(last_modified) if last_modified else None)
+
+    def _write(self, offset, book_id, generation, payload):
+        seq = SEQ.unpack_from(self._map, offset)[0]
+        # a writer that died mid-update leaves the counter odd
+        seq |= 1
+        SEQ.pack_into(self._map, offset, seq)
+        SLOT.pack_into(self._map, offset, seq, book_id, generation, len(payload), time.monotonic_ns())
+        start = offset + SLOT.size
+        self._map[start:start + len(payload)] = payload
+        SEQ.pack_into(self._map, offset, seq + 1)
+
+    def put(self, book_id, entry, epoch, max_entries=None, ttl=None):
+        # max_entries is fixed by the slot count here, and entries need no
+        # ttl: a write in any worker invalidates them for all
+        body, etag, last_modified = entry
+        etag = etag.encode()
+        last_modified = last_modified.isoformat().encode() if last_modified else b""
+        payload = ENTRY.pack(len(etag), len(last_modified)) + etag + last_modified + body
+        if len(payload) > self.capacity:
+            with self._lock:
+                self.oversize += 1
+            return
+
+        with self._mutex():
+            if epoch != self.epoch:
+                return
+            generation = self._generation()
+            victim = None
+            for offset in self._offsets(book_id):
+                _, slot_id, slot_generation, _, stamp = SLOT.unpack_from(self._map, offset)
+                if slot_id == book_id or not slot_id or slot_generation != generation:
+                    victim, evicts = offset, False
+                    break
+                if victim is None or stamp < oldest:
+                    victim, evicts, oldest = offset, True, stamp
+            self._write(victim, book_id, generation, payload)
+            if evicts:
+                self.evictions += 1
+
+    def apply(self, upserted, deleted, reload):
+        with self._mutex():
+            EPOCH.pack_into(self._map, EPOCH_OFFSET, self.epoch + 1)
+            generation = self._generation()
+            if reload:
+                EPOCH.pack_into(self._map, GENERATION_OFFSET, generation + 1)
+                return
+            for book_id in list(upserted) + list(deleted):
+                for offset in self._offsets(book_id):
+                    _, slot_id, slot_generation, _, _ = SLOT.unpack_from(self._map, offset)
+                    if slot_id == book_id and slot_generation == generation:
+                        self._write(offset, 0, generation, b"")
+                        self.invalidations += 1
+
+    def stats(self):
+        generation = self._generation()
+        entries = 0
+        for index in range(self.slots):
+            _, slot_id, slot_generation, _, _ = SLOT.unpack_from(self._map, HEADER_SIZE + index * self.slot_size)
+            if slot_id and slot_generation == generation:
+                entries += 1
+        with self._lock:
+            # hits, misses and evictions are this worker's; entries are shared
+            return {"tier": "shared", "slots": self.slots, "entries": entries, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "invalidations": self.invalidations,
+                    "oversize": self.oversize}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_shared_cache(path, slots, slot_size):
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = SharedItemCache(path, slots, slot_size)
+        return cache
@@ -0,0 +1,84 @@
+import threading
+from functools import wraps
+
+from flask import Response, current_app, request
+from flask_restful.utils import unpack
+
+from utils.http import encode_json, json_response
+from utils.streaming import wants_stream
+
+# request headers that change what a read returns
+VARY_HEADERS = ("Accept", "If-None-Match", "If-Modified-Since")
+
+
+class SingleFlight:
+    # Identical reads that overlap share one computation: the first request
+    # for a key runs it and the others wait for its encoded response.
+    # Nothing is kept once the leader finishes; this only collapses
+    # concurrent requests and leaves caching to the caches. Followers whose
+    # leader fails or takes longer than wait_timeout run the read themselves.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    def run(self, key, fn, wait_timeout):
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = {"event": threading.Event(), "result": None}
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if call["event"].wait(wait_timeout) and call["result"] is not None:
+                return call["result"], True
+            with self._lock:
+                self.fallbacks += 1
+            return fn(), False
+
+        try:
+            call["result"] = fn()
+            return call["result"], False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call["event"].set()
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._in_flight), "leaders": self.leaders,
+                    "coalesced": self.coalesced, "fallbacks": self.fallbacks}
+
+
+single_flight = SingleFlight()
+
+
+def _freeze(rv):
+    if not isinstance(rv, Response):
+        data, status, headers = unpack(rv)
+        rv = json_response(encode_json(data), status, headers)
+    headers = [(name, value) for name, value in rv.headers.items() if name != "Content-Length"]
+    return rv.status_code, headers, rv.get_data()
+
+
+def coalesced(fn):
+    # Wraps a flask-restful GET; streamed responses are not shared.
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if wants_stream(request):
+            return fn(*args, **kwargs)
+        key = (request.path, tuple(sorted(request.args.items(multi=True))),
+               tuple(request.headers.get(name) for name in VARY_HEADERS))
+        (status, headers, body), shared = single_flight.run(key, lambda: _freeze(fn(*args, **kwargs)),
+                                                            current_app.config["BOOKS_COALESCE_WAIT_TIMEOUT"])
+        response = Response(body, status=status, headers=headers)
+        if shared:
+            response.headers["X-Coalesced"] = "true"
+        return response
+    return wrapper
@@ -0,0 +1,198 @@
+import fcntl
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response, current_app, has_app_context, request
+from werkzeug.wsgi import wrap_file
+
+from models.book import Book, db
+from schemas.book import get_dumper
+from utils.changes import on_books_changed
+from utils.conditional import catalog_stamp
+from utils.files import instance_path, open_private, private_directory
+from utils.rows import row_select
+from utils.streaming import JSON, NDJSON
+
+log = logging.getLogger(__name__)
+
+META = "catalog.meta"
+
+
+class CatalogSnapshot:
+    # The unfiltered GET /books?stream=1 listing, pre-encoded on disk as
+    # JSON and NDJSON (plus gzip copies) and sent as a file. catalog.meta
+    # names the current files and the catalog version they were built at; a
+    # snapshot is only served while that version still matches the database,
+    # so it stays valid across restarts and writes made by any worker.
+    #
+    # Writes (and requests that find the snapshot stale) schedule a rebuild
+    # on a background thread once no change has arrived for debounce
+    # seconds. Files are written under new names and catalog.meta is
+    # swapped with a rename, so readers always see a complete snapshot.
+    # Each worker keeps the parsed catalog.meta and only rereads it when
+    # the catalog version no longer matches, so a hit costs the version
+    # lookup and opening the file.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._thread = None
+        self._app = None
+        self._changed_at = 0
+        self._meta = (None, None)
+        self.builds = 0
+        self.served = 0
+        self.stale = 0
+        self.failures = 0
+
+    def response(self, version, ndjson):
+        if not current_app.config["BOOKS_SNAPSHOT_DIR"]:
+            return None
+        directory = instance_path(current_app, current_app.config["BOOKS_SNAPSHOT_DIR"])
+        cached_directory, meta = self._meta
+        if cached_directory != directory or meta is None or meta["version"] != version:
+            # only read catalog.meta again when the version moved: another
+            # worker may have built a newer snapshot
+            meta = self._read_meta(directory)
+            self._meta = (directory, meta)
+        if meta is None or meta["version"] != version:
+            with self._lock:
+                self.stale += 1
+            # reads never push the rebuild back, only writes do
+            self.schedule(postpone=False)
+            return None
+
+        name = meta["name"] + (".ndjson" if ndjson else ".json")
+        compressed = meta["gzip"] and request.accept_encodings["gzip"] > 0
+        try:
+            # an older snapshot may just have been removed; serve live then
+            f = open(os.path.join(directory, name + (".gz" if compressed else "")), "rb")
+        except FileNotFoundError:
+            self._meta = (None, None)
+            return None
+        response = Response(wrap_file(request.environ, f), mimetype=NDJSON if ndjson else JSON,
+                            direct_passthrough=True)
+        response.content_length = os.fstat(f.fileno()).st_size
+        if compressed:
+            response.content_encoding = "gzip"
+        response.vary.add("Accept-Encoding")
+        with self._lock:
+            self.served += 1
+        return response
+
+    @staticmethod
+    def _read_meta(directory):
+        try:
+            # a directory someone else could write to is never trusted
+            private_directory(directory, create=False)
+            with open(os.path.join(directory, META)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if "version" in meta else None
+
+    def schedule(self, postpone=True):
+        app = current_app._get_current_object()
+        if not app.config["BOOKS_SNAPSHOT_DIR"]:
+            return
+        with self._lock:
+            self._app = app
+            if postpone:
+                self._changed_at = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="catalog-snapshot", daemon=True)
+                self._thread.start()
+        self._pending.set()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            while True:
+                with self._lock:
+                    app = self._app
+                    delay = self._changed_at + app.config["BOOKS_SNAPSHOT_DEBOUNCE_MS"] / 1000 - time.monotonic()
+                if delay <= 0:
+                    break
+                time.sleep(delay)
+            self._pending.clear()
+            try:
+                with app.app_context():
+                    self.build(db.session, instance_path(app, app.config["BOOKS_SNAPSHOT_DIR"]),
+                               app.config["BOOKS_SNAPSHOT_GZIP"],
+                               app.config["BOOKS_STREAM_BATCH_SIZE"])
+            except Exception:
+                log.exception("catalog snapshot build failed")
+                with self._lock:
+                    self.failures += 1
+
+    def build(self, session, directory, compress, batch_size):
+        # Returns False when another worker already built a snapshot of the
+        # current version.
+        private_directory(directory)
+        meta_path = os.path.join(directory, META)
+        lock = open_private(os.path.join(directory, "catalog.lock"))
+        try:
+            fcntl.lockf(lock, fcntl.LOCK_EX)
+            # the version is read first: rows committed while dumping bump it,
+            # so such a snapshot is newer than its version and is just not used
+            version = catalog_stamp(session)[0]
+            meta = self._read_meta(directory)
+            if meta is not None and meta["version"] == version:
+                return False
+            name = "catalog-%d" % time.time_ns()
+            self._write(session, directory, name, compress, batch_size)
+            tmp = os.path.join(directory, META + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump({"version": version, "name": name, "gzip": compress}, f)
+            os.replace(tmp, meta_path)
+            for entry in os.listdir(directory):
+                if entry.startswith("catalog-") and not entry.startswith(name + "."):
+                    os.remove(os.path.join(directory, entry))
+        finally:
+            os.close(lock)
+            session.rollback()
+        with self._lock:
+            self.builds += 1
+        return True
+
+    def _write(self, session, directory, name, compress, batch_size):
+        paths = [os.path.join(directory, name + suffix) for suffix in (".json", ".ndjson")]
+        files = [open(path + ".tmp", "wb") for path in paths]
+        if compress:
+            files += [gzip.open(path + ".gz.tmp", "wb") for path in paths]
+        dump = get_dumper(many=True)
+        statement = row_select(db.select(Book).order_by(Book.id)).execution_options(yield_per=batch_size)
+        try:
+            separator = b"["
+            for batch in session.execute(statement).partitions():
+                items = [json.dumps(item).encode() for item in dump(batch)]
+                chunks = (separator + b",".join(items), b"".join(item + b"\n" for item in items))
+                separator = b","
+                for index, f in enumerate(files):
+                    f.write(chunks[index % 2])
+            for f in files[::2]:
+                f.write(b"[]\n" if separator == b"[" else b"]\n")
+        finally:
+            for f in files:
+                f.close()
+        for path in paths:
+            os.replace(path + ".tmp", path)
+            if compress:
+                os.replace(path + ".gz.tmp", path + ".gz")
+
+    def stats(self):
+        with self._lock:
+            return {"builds": self.builds, "served": self.served, "stale": self.stale, "failures": self.failures}
+
+
+catalog_snapshot = CatalogSnapshot()
+
+
+@on_books_changed
+def _rebuild_snapshot(upserted, deleted, reload):
+    if has_app_context():
+        catalog_snapshot.schedule()
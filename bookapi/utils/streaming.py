@@ -0,0 +1,34 @@
+import json
+
+from flask import Response, stream_with_context
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+
+
+def wants_ndjson(request):
+    return request.accept_mimetypes.best_match([JSON, NDJSON]) == NDJSON
+
+
+def wants_stream(request):
+    return request.args.get("stream", "").lower() in ("1", "true", "yes") or wants_ndjson(request)
+
+
+def stream_response(session, statement, dump, ndjson, batch_size):
+    # yield_per makes the psycopg2 dialect use a named (server-side) cursor,
+    # so only one batch of rows is ever held in memory. Each batch is encoded
+    # and written out before the next one is fetched.
+    def generate():
+        result = session.execute(statement.execution_options(yield_per=batch_size))
+        if ndjson:
+            for batch in result.partitions():
+                yield "".join(json.dumps(item) + "\n" for item in dump(batch))
+            return
+
+        separator = "["
+        for batch in result.partitions():
+            yield separator + ",".join(json.dumps(item) for item in dump(batch))
+            separator = ","
+        yield "[]\n" if separator == "[" else "]\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON if ndjson else JSON)
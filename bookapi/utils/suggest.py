@@ -0,0 +1,194 @@
+import logging
+import sys
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import select
+
+from models.book import Book, db
+from utils.changes import on_books_changed
+from utils.conditional import catalog_stamp
+
+log = logging.getLogger(__name__)
+
+# seconds before a failed build is retried (the table may not exist yet)
+RETRY_SECONDS = 5
+
+
+def normalize(value):
+    # case- and accent-insensitive, whitespace collapsed
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return " ".join(value.casefold().split())
+
+
+class SuggestIndex:
+    # Sorted array of (normalized, text, kind) entries searched with bisect.
+    # Entries are reference counted so an author shared by many books is
+    # stored once; _books remembers what each id contributed so updates and
+    # deletes can be applied without touching the database.
+    #
+    # Requests never build it. A background thread scans the table once a
+    # worker serves its first request (suggestions get 503 until then),
+    # after a bulk load, and every refresh interval when the catalog version
+    # moved, which picks up writes made by other workers. The scan runs outside the lock; changes
+    # committed meanwhile are replayed onto the new index before it is
+    # swapped in, and the old one keeps answering until then.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._entries = []
+        self._counts = {}
+        self._books = {}
+        self._version = None
+        self._stale = False
+        self._building = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._app = None
+        self.ready = False
+        self.builds = 0
+        self.failures = 0
+
+    def init_app(self, app):
+        # started by the first request a worker serves, whatever its path:
+        # CLI commands and scripts that import the app never scan the table
+        if app.config["BOOKS_SUGGEST_PRELOAD"]:
+            app.before_request(self._start)
+
+    def _start(self):
+        if self._thread is None:
+            self.schedule(current_app._get_current_object())
+
+    def schedule(self, app):
+        with self._lock:
+            self._app = app
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="suggest-index", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            app = self._app
+            wait = app.config["BOOKS_SUGGEST_REFRESH_SECONDS"]
+            try:
+                with app.app_context():
+                    self.build(db.session, app.config["BOOKS_STREAM_BATCH_SIZE"])
+            except Exception:
+                log.exception("suggest index build failed")
+                with self._lock:
+                    self.failures += 1
+                wait = min(wait, RETRY_SECONDS)
+            self._wake.wait(wait)
+
+    def build(self, session, batch_size=1000):
+        # Returns False when the index is current and nothing was read.
+        with self._build_lock:
+            return self._build(session, batch_size)
+
+    def _build(self, session, batch_size):
+        try:
+            version = catalog_stamp(session)[0]
+            with self._lock:
+                if self.ready and not self._stale and version == self._version:
+                    return False
+                self._building = []
+            counts, books = {}, {}
+            statement = select(Book.id, Book.title, Book.author).execution_options(yield_per=batch_size)
+            for book_id, title, author in session.execute(statement):
+                books[book_id] = (title, author)
+                for entry in self._book_entries(title, author):
+                    counts[entry] = counts.get(entry, 0) + 1
+            entries = sorted(counts)
+        except Exception:
+            with self._lock:
+                self._building = None
+            raise
+        finally:
+            session.rollback()
+
+        with self._lock:
+            pending, self._building = self._building, None
+            self._entries, self._counts, self._books = entries, counts, books
+            self._version, self._stale = version, False
+            for upserted, deleted, reload in pending:
+                self._stale = self._stale or reload
+                self._apply_rows(upserted, deleted)
+            self.ready = True
+            self.builds += 1
+        if self._stale:
+            self._wake.set()
+        return True
+
+    def suggest(self, prefix, limit=10):
+        key = normalize(prefix)
+        results = []
+        with self._lock:
+            i = bisect_left(self._entries, (key,))
+            while i < len(self._entries) and len(results) < limit:
+                normalized, text, kind = self._entries[i]
+                if not normalized.startswith(key):
+                    break
+                results.append({"text": text, "type": kind})
+                i += 1
+        return results
+
+    def apply(self, upserted, deleted, reload):
+        with self._lock:
+            if self._building is not None:
+                self._building.append((upserted, deleted, reload))
+            if not self.ready:
+                # nothing built yet; the first build reads the committed rows
+                return
+            if not reload:
+                self._apply_rows(upserted, deleted)
+                return
+            # too large to apply row by row: keep answering from the old
+            # index until the background rebuild replaces it
+            self._stale = True
+        self._wake.set()
+
+    def _apply_rows(self, upserted, deleted):
+        for book_id in deleted:
+            self._remove(book_id)
+        for book_id, row in upserted.items():
+            self._remove(book_id)
+            self._books[book_id] = (row["title"], row["author"])
+            for entry in self._book_entries(row["title"], row["author"]):
+                self._counts[entry] = self._counts.get(entry, 0) + 1
+                if self._counts[entry] == 1:
+                    insort(self._entries, entry)
+
+    def stats(self):
+        with self._lock:
+            size = sys.getsizeof(self._entries) + sys.getsizeof(self._counts) + sys.getsizeof(self._books)
+            for entry in self._counts:
+                size += sys.getsizeof(entry) + sum(sys.getsizeof(part) for part in entry)
+            for value in self._books.values():
+                size += sys.getsizeof(value)
+            return {"ready": self.ready, "stale": self._stale, "books": len(self._books),
+                    "entries": len(self._entries), "memory_bytes": size, "builds": self.builds,
+                    "failures": self.failures}
+
+    def _remove(self, book_id):
+        old = self._books.pop(book_id, None)
+        if old is None:
+            return
+        for entry in self._book_entries(*old):
+            self._counts[entry] -= 1
+            if not self._counts[entry]:
+                del self._counts[entry]
+                del self._entries[bisect_left(self._entries, entry)]
+
+    @staticmethod
+    def _book_entries(title, author):
+        return {(normalize(title), title, "title"), (normalize(author), author, "author")}
+
+
+suggest_index = SuggestIndex()
+on_books_changed(suggest_index.apply)
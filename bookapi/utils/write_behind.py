@@ -0,0 +1,141 @@
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from sqlalchemy.exc import IntegrityError
+
+from models.book import db
+from utils.bulk import insert_books
+from utils.cache_backends import create_backend
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    # Opt-in asynchronous POST /books. Validated rows go on a bounded queue;
+    # one writer thread drains it and writes up to batch_size rows per
+    # multi-row INSERT and commit, waiting at most flush_ms for a batch to
+    # fill. A full queue is reported to the caller (503) instead of growing.
+    # Rows still queued when the process dies are lost, which is the price
+    # of answering before the commit.
+    #
+    # Job states go to a cache backend (BOOKS_ASYNC_JOB_URL), so a status
+    # poll can be answered by any worker when that backend is shared
+    # (sqlite or redis); with memory:// only the worker that queued the job
+    # knows about it.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._jobs = None
+        self.batches = 0
+        self.written = 0
+        self.rejected = 0
+
+    def submit(self, app, row):
+        config = app.config
+        with self._lock:
+            if self._thread is None:
+                self._queue = queue.Queue(maxsize=config["BOOKS_ASYNC_QUEUE_SIZE"])
+                self._thread = threading.Thread(target=self._run, args=(app,), name="books-write-behind",
+                                                daemon=True)
+                self._thread.start()
+        jobs = self._job_store(app)
+        job_id = uuid.uuid4().hex
+        # stored before the row is queued, so the writer never finishes a
+        # job whose "queued" state could still overwrite the result
+        self._set_job(app, jobs, job_id, {"status": "queued"})
+        try:
+            self._queue.put_nowait((job_id, row))
+        except queue.Full:
+            jobs.delete("job:" + job_id)
+            with self._lock:
+                self.rejected += 1
+            return None
+        return job_id
+
+    def job(self, app, job_id):
+        value = self._job_store(app).get("job:" + job_id)
+        return json.loads(value) if value is not None else None
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queue.qsize() if self._queue else 0, "batches": self.batches,
+                    "written": self.written, "rejected": self.rejected}
+
+    def _job_store(self, app):
+        with self._lock:
+            if self._jobs is None:
+                self._jobs = create_backend(app.config["BOOKS_ASYNC_JOB_URL"], app.config["BOOKS_ASYNC_MAX_JOBS"])
+            return self._jobs
+
+    @staticmethod
+    def _set_job(app, jobs, job_id, state):
+        # kept for BOOKS_ASYNC_JOB_TTL seconds (and, in memory, for the
+        # newest BOOKS_ASYNC_MAX_JOBS submissions)
+        jobs.set("job:" + job_id, json.dumps(state).encode(), app.config["BOOKS_ASYNC_JOB_TTL"])
+
+    def _take_batch(self, batch_size, flush_seconds):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + flush_seconds
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, app):
+        batch_size = app.config["BOOKS_ASYNC_BATCH_SIZE"]
+        flush_seconds = app.config["BOOKS_ASYNC_FLUSH_MS"] / 1000.0
+        while True:
+            batch = self._take_batch(batch_size, flush_seconds)
+            with app.app_context():
+                try:
+                    results = self._write(batch, batch_size)
+                except Exception as err:
+                    log.exception("write-behind batch of %d rows failed", len(batch))
+                    db.session.rollback()
+                    results = [{"status": "failed", "error": str(err)} for _ in batch]
+            with self._lock:
+                self.batches += 1
+                self.written += sum(state["status"] == "done" for state in results)
+            jobs = self._job_store(app)
+            for (job_id, _), state in zip(batch, results):
+                try:
+                    self._set_job(app, jobs, job_id, state)
+                except Exception:
+                    # the rows are committed; only the status poll is lost
+                    log.exception("could not store the state of write-behind job %s", job_id)
+
+    def _write(self, batch, batch_size):
+        rows = [row for _, row in batch]
+        try:
+            ids = insert_books(db.session, rows, batch_size)
+            db.session.commit()
+            return [{"status": "done", "book": dict(row, id=book_id)} for row, book_id in zip(rows, ids)]
+        except IntegrityError:
+            db.session.rollback()
+
+        # one row broke the batch (a duplicate); write the rest one by one
+        # so only the offending jobs fail
+        results = []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    book_id = insert_books(db.session, [row], 1)[0]
+                results.append({"status": "done", "book": dict(row, id=book_id)})
+            except IntegrityError:
+                results.append({"status": "failed", "error": "A book with this title and author already exists"})
+        db.session.commit()
+        return results
+
+
+write_behind = WriteBehindQueue()